@@ -0,0 +1,257 @@
+'''Benchmarks for the data pipeline stages in functions.py. Each benchmark builds a synthetic frame and times the current
+implementation against the previous one.
+
+Run with: python benchmarks.py [number of activities]'''
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import functions as fn
+
+def make_raw_activities(n: int, seed: int = 0) -> pd.DataFrame:
+    '''This function builds a frame shaped like the Strava activities response, with the distance already in miles under the
+    name the app reads after gear is merged in
+
+    Args:
+        n (int): Number of activities
+        seed (int): Random seed
+
+    Returns:
+        df (DataFrame): Synthetic activities with raw Strava types'''
+
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2015-01-01', tz='UTC') + pd.to_timedelta(np.sort(rng.integers(0, 10 * 365 * 24 * 3600, n)), unit='s')
+    local = start - pd.Timedelta(hours=5)
+
+    return pd.DataFrame({
+        'id': np.arange(n),
+        'type': rng.choice(['Run', 'Ride', 'Walk', 'Hike', 'Swim'], n),
+        'distance_activity': rng.gamma(2, 2.5, n),
+        'moving_time': rng.integers(600, 30 * 3600, n),
+        'elapsed_time': rng.integers(600, 30 * 3600, n),
+        'start_date': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'start_date_local': local.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    })
+
+def timeit(func, *args, repeat: int = 3) -> float:
+    '''This function returns the best time in seconds of several runs. Arguments are copied before every run'''
+
+    best = float('inf')
+    for _ in range(repeat):
+        copies = [arg.copy() if isinstance(arg, (pd.DataFrame, pd.Series)) else arg for arg in args]
+        start = time.perf_counter()
+        func(*copies)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def report(name: str, before: float, after: float) -> None:
+    print(f"{name:<28} before {before * 1000:>9.1f} ms   after {after * 1000:>9.1f} ms   {before / after:>6.1f}x")
+
+##### PREVIOUS IMPLEMENTATIONS #####
+def legacy_parse_timestamps(df: pd.DataFrame) -> pd.DataFrame:
+    df['start_date'] = pd.to_datetime(pd.to_datetime(df['start_date']).dt.strftime('%Y-%m-%d %H:%M:%S'))
+    df['start_date_local'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m-%d %H:%M:%S'))
+    return df
+
+def legacy_parse_durations(df: pd.DataFrame) -> pd.DataFrame:
+    df['moving_time'] = pd.to_timedelta(pd.to_datetime(df['moving_time'], unit='s').dt.strftime('%H:%M:%S'))
+    df['elapsed_time'] = pd.to_timedelta(pd.to_datetime(df['elapsed_time'], unit='s').dt.strftime('%H:%M:%S'))
+    return df
+
+def legacy_date_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df['start_time_local_24h'] = pd.to_datetime(df['start_date_local'])
+    df['start_time_local_24h_hour'] = pd.to_datetime(df['start_date_local']).dt.round('H').dt.hour
+    df['start_time_local_12h'] = pd.to_datetime(df['start_date_local']).dt.strftime("%I:%M %p")
+    df['weekday'] = pd.to_datetime(df['start_date_local']).dt.day_name()
+    df['weekday_num'] = pd.to_datetime(df['start_date_local']).dt.weekday
+    df['month'] = pd.to_datetime(df['start_date_local']).dt.month_name()
+    df['month_num'] = pd.to_datetime(df['start_date_local']).dt.month
+    df['monthly_date'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m')).apply(lambda x: x.replace(year=2025))
+    df['month_year'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m'))
+    df['month_year_name'] = pd.to_datetime(df['start_date_local']).dt.strftime('%b %Y')
+    df['year'] = pd.to_datetime(df['start_date_local']).dt.year
+    return df
+
+def legacy_transform(df: pd.DataFrame) -> pd.DataFrame:
+    return legacy_date_columns(legacy_parse_timestamps(legacy_parse_durations(df)))
+
+def legacy_filter(df: pd.DataFrame, year_selection, act_type_selection: list, gear_brand_selection: list, rolling_12_months) -> pd.DataFrame:
+    if year_selection == 'All':
+        year = "year != 'None'"
+    elif year_selection == 'Rolling 12 Months':
+        year = "start_date_local >= @rolling_12_months"
+    else:
+        year = "year == @year_selection"
+    return df.query(f"type in @act_type_selection and {year} and brand_name in @gear_brand_selection")
+
+def legacy_encode(df: pd.DataFrame) -> list:
+    df['moving_time'] = df['moving_time'].astype(str)
+    df['elapsed_time'] = df['elapsed_time'].astype(str)
+    df['start_time_local_24h'] = df['start_time_local_24h'].apply(lambda x: x.strftime('%H:%M:%S'))
+    df['start_date'] = df['start_date'].apply(lambda x: x.isoformat())
+    df['start_date_local'] = df['start_date_local'].apply(lambda x: x.isoformat())
+    df['monthly_date'] = df['monthly_date'].apply(lambda x: x.isoformat())
+    df['month_year'] = df['month_year'].apply(lambda x: x.isoformat())
+    return df.replace({np.nan: None}).to_dict(orient='records')
+
+def legacy_decode(df: pd.DataFrame) -> pd.DataFrame:
+    df['moving_time'] = pd.to_timedelta(df['moving_time'])
+    df['elapsed_time'] = pd.to_timedelta(df['elapsed_time'])
+    df['start_time_local_24h'] = pd.to_datetime(df['start_time_local_24h']).dt.time
+    df['start_date'] = pd.to_datetime(pd.to_datetime(df['start_date']).dt.strftime('%Y-%m-%d %H:%M:%S'))
+    df['start_date_local'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m-%d %H:%M:%S'))
+    df['monthly_date'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m'))
+    df['month_year'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m'))
+    return df
+
+##### CURRENT IMPLEMENTATIONS #####
+def parse_timestamps(df: pd.DataFrame) -> pd.DataFrame:
+    df['start_date'] = fn.parse_timestamp(df['start_date'])
+    df['start_date_local'] = fn.parse_timestamp(df['start_date_local'])
+    return df
+
+def parse_durations(df: pd.DataFrame) -> pd.DataFrame:
+    df['moving_time'] = fn.parse_duration(df['moving_time'])
+    df['elapsed_time'] = fn.parse_duration(df['elapsed_time'])
+    return df
+
+def benchmark_transform(n: int) -> None:
+    '''This function times each stage of the activity transform'''
+
+    raw = make_raw_activities(n)
+    parsed = parse_timestamps(raw.copy())
+
+    print(f"Transform stage, {n:,} activities")
+    report('parse timestamps', timeit(legacy_parse_timestamps, raw), timeit(parse_timestamps, raw))
+    report('parse durations', timeit(legacy_parse_durations, raw), timeit(parse_durations, raw))
+    report('date columns', timeit(legacy_date_columns, parsed), timeit(fn.add_date_columns, parsed))
+    report('full transform', timeit(legacy_transform, raw), timeit(fn.transform_activities, raw))
+
+def benchmark_codec(n: int) -> None:
+    '''This function times encoding rows for the database and decoding them again'''
+
+    df = fn.transform_activities(make_raw_activities(n))
+    encoded = fn.encode_activities(df)
+
+    print(f"Database codec, {n:,} activities")
+    report('encode to records', timeit(legacy_encode, df), timeit(lambda frame: fn.encode_activities(frame).to_dict(orient='records'), df))
+    report('decode', timeit(legacy_decode, encoded), timeit(fn.decode_activities, encoded))
+
+def benchmark_filter(n: int) -> None:
+    '''This function times resolving the page filters with df.query against the bitmap and sorted time indexes'''
+
+    rng = np.random.default_rng(1)
+    df = fn.transform_activities(make_raw_activities(n))
+    df['brand_name'] = rng.choice(np.array(['Nike', 'Hoka', 'Brooks', 'Trek', None], dtype=object), n)
+
+    index = fn.ActivityIndex(df)
+    rolling_start = df['start_date_local'].max() - pd.DateOffset(months=12)
+    types, brands = ['Run', 'Walk', 'Hike'], ['Nike', 'Hoka', 'Brooks']
+
+    print(f"Filtering, {n:,} activities")
+    print(f"{'build indexes':<28} {timeit(fn.ActivityIndex, df) * 1000:>9.1f} ms")
+    for year in ['All', 'Rolling 12 Months', int(df['year'].iloc[n // 2])]:
+        before = timeit(legacy_filter, df, year, types, brands, rolling_start)
+        after = timeit(lambda: df.take(index.select(year, types, brands, rolling_start)))
+        report(f'filter {year}', before, after)
+
+def benchmark_cube(n: int) -> None:
+    '''This function times a monthly chart aggregation from the activities against a roll up of the metrics cube'''
+
+    rng = np.random.default_rng(2)
+    df = fn.transform_activities(make_raw_activities(n))
+    df['upload_id'] = df['id']
+    df['brand_name'] = rng.choice(np.array(['Nike', 'Hoka', 'Brooks', 'Trek', None], dtype=object), n)
+    df['name_gear'] = df['brand_name'] + ' ' + rng.choice(['1', '2', '3'], n)
+    df['total_elevation_gain'] = rng.gamma(2, 50, n)
+    df['average_speed'] = rng.normal(6, 1, n)
+
+    cells = fn.build_cube_cells(df)
+    by, metrics = ['month_year', 'type'], {'Distance': ('distance_activity', 'sum'), 'Speed': ('average_speed', 'mean')}
+
+    print(f"Metrics cube, {n:,} activities, {len(cells):,} cells")
+    print(f"{'build cube':<28} {timeit(fn.build_cube_cells, df) * 1000:>9.1f} ms")
+    report('monthly by type', timeit(lambda: df.groupby(by).agg(**metrics).reset_index()), timeit(fn.rollup_cells, cells, by, metrics))
+
+def benchmark_box(n: int) -> None:
+    '''This function compares the size of a monthly box plot with every point against the summarized box plot'''
+
+    import plotly.express as px
+
+    df = fn.transform_activities(make_raw_activities(n))
+
+    before = px.box(df, x='month_year', y='distance_activity', points='all')
+    after = fn.box_plot(df, 'month_year', 'distance_activity')
+
+    print(f"Box plots, {n:,} activities")
+    report('build figure', timeit(lambda frame: px.box(frame, x='month_year', y='distance_activity', points='all'), df),
+           timeit(fn.box_plot, df, 'month_year', 'distance_activity'))
+    # the figure is serialized on every render, which is where sending every point costs the most
+    report('build and serialize', timeit(lambda frame: px.box(frame, x='month_year', y='distance_activity', points='all').to_json(), df),
+           timeit(lambda frame: fn.box_plot(frame, 'month_year', 'distance_activity').to_json(), df))
+    print(f"{'figure json':<28} before {len(before.to_json()) / 1e6:>9.2f} MB   after {len(after.to_json()) / 1e6:>9.2f} MB")
+
+def benchmark_scatter(n: int) -> None:
+    '''This function compares the number of points in a weather scatter chart before and after binning'''
+
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({
+        'temp': rng.normal(60, 15, n),
+        'rhum': rng.uniform(20, 100, n),
+        'type': rng.choice(['Run', 'Ride', 'Walk', 'Hike', 'Swim'], n),
+    })
+
+    binned, _ = fn.bin_scatter(df, 'temp', 'rhum', 'type')
+
+    print(f"Weather scatter, {n:,} activities, {len(binned):,} bins")
+    print(f"{'bin points':<28} {timeit(fn.bin_scatter, df, 'temp', 'rhum', 'type') * 1000:>9.1f} ms")
+    print(f"{'chart json':<28} before {len(df.to_json(orient='records')) / 1e6:>9.2f} MB   after {len(binned.to_json(orient='records')) / 1e6:>9.2f} MB")
+
+def benchmark_postgres(n: int, dsn: str, table: str = 'tom_runs_the_world_benchmark') -> None:
+    '''This function times a bulk load and a streamed read against a local Postgres stand-in. The benchmark table is created
+    from the synthetic frame and dropped afterwards'''
+
+    df = fn.transform_activities(make_raw_activities(n).rename(columns={'id': 'id_activity'}))
+    df['refresh_date'] = pd.Timestamp.now().strftime('%Y-%m-%d %I:%M %p')
+    columns = fn.encode_activities(df).columns
+
+    conn = fn.get_postgres_connection(dsn)
+    with conn, conn.cursor() as cur:
+        column_types = [fn.sql.SQL('{} bigint PRIMARY KEY' if col == 'id_activity' else '{} text').format(fn.sql.Identifier(col)) for col in columns]
+        cur.execute(fn.sql.SQL('CREATE TABLE IF NOT EXISTS {} ({})').format(fn.sql.Identifier(table), fn.sql.SQL(', ').join(column_types)))
+
+    print(f"Postgres, {n:,} activities")
+    try:
+        load = timeit(fn.copy_data_to_postgres, df, table, dsn, repeat=1)
+        read = timeit(fn.read_postgres_batches, None, None, 5000, table, dsn, repeat=1)
+        print(f"{'COPY bulk load':<28} {load:>9.2f} s")
+        print(f"{'server-side cursor read':<28} {read:>9.2f} s")
+    finally:
+        with conn, conn.cursor() as cur:
+            cur.execute(fn.sql.SQL('DROP TABLE {}').format(fn.sql.Identifier(table)))
+        conn.close()
+
+if __name__ == '__main__':
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    benchmark_transform(n)
+    print()
+    benchmark_codec(n)
+    print()
+    benchmark_filter(n)
+    print()
+    benchmark_cube(n)
+    print()
+    benchmark_box(n)
+    print()
+    benchmark_scatter(n)
+
+    # point BENCHMARK_DSN at a local Postgres to benchmark the direct database path
+    if os.environ.get('BENCHMARK_DSN'):
+        print()
+        benchmark_postgres(n, os.environ['BENCHMARK_DSN'])
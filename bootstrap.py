@@ -0,0 +1,117 @@
+'''Shared start of every page. Draws the logo, the header, and the filter sidebar from the metadata of the shared dataset,
+which is worked out once per dataset version instead of on every rerun of every page.
+
+Usage at the top of a page:
+    df, year_selection, act_type_selection, gear_brand_selection, rolling_12_months, dataset = bootstrap.render_page()'''
+
+from typing import NamedTuple
+
+import pandas as pd
+import streamlit as st
+
+import functions as fn
+
+SIDEBAR_LOGO = './images/tom_runs_the_world_sidebar.png'
+TITLE_LOGO = './images/tom_runs_the_world_title.png'
+HIGHLIGHTED_ACTIVITIES = ['Run', 'Hike', 'Walk', 'Ride']
+
+class Page(NamedTuple):
+    '''Data and filter selections a page builds its charts from. The names match what df_query_builder, rollup_metrics and
+    cached_section read from the page globals, so pages unpack it into module level variables. dataset is the Dataset the
+    page loaded, so cached results are keyed by the version they were built from even if a newer one is loaded mid run'''
+
+    df: pd.DataFrame
+    year_selection: str
+    act_type_selection: list
+    gear_brand_selection: list
+    rolling_12_months: pd.Timestamp
+    dataset: fn.Dataset
+
+def render_refresh_button() -> None:
+    '''This function draws the Refresh Data button, which starts the background refresh shared by every session'''
+
+    if st.button('Refresh Data', help='Refresh data from Strava API. The current data stays available while it runs.'):
+        # the refresh runs in the background and is shared by every session
+        if not fn.get_refresh_job().start():
+            st.toast('A refresh is already running.')
+
+def render_freshness(refresh_date: str) -> None:
+    '''This function shows how old the data is and whether it should be refreshed
+
+    Args:
+        refresh_date (str): When the data was last refreshed'''
+
+    refresh_age = pd.Timestamp.now(tz='America/New_York') - pd.to_datetime(refresh_date).tz_localize('America/New_York')
+    if refresh_age.days < 7:
+        st.success("Data is under one week old. You're in good shape!")
+    elif refresh_age.days >= 7 and refresh_age.days <=14:
+        st.warning('Data is over one week old. Refreshing is recommended.')
+    else:
+        st.error('Data is over two weeks old. Please refresh.')
+
+def render_filters(metadata: fn.DatasetMetadata) -> tuple:
+    '''This function draws the filter sidebar. Selections are kept in session state so they carry across pages
+
+    Args:
+        metadata (DatasetMetadata): Filter options of the current dataset
+
+    Returns:
+        year_selection (str): Selected year
+        act_type_selection (list): Selected activity types
+        gear_brand_selection (list): Selected gear brands'''
+
+    with st.sidebar:
+
+        st.header('Filters')
+
+        # initialize year selection
+        st.session_state.year_selection = st.session_state.get('year_selection', fn.default_year_selection())
+        year_selection = st.selectbox('Years', metadata.year_filter, key='year_selection')
+
+        # initialize activity type selection
+        st.session_state.act_type_selection = st.session_state.get('act_type_selection', fn.default_activity_selection(HIGHLIGHTED_ACTIVITIES))
+        act_type_selection = st.multiselect('Activity Type', metadata.act_types, placeholder='Select Activity Type', key='act_type_selection')
+
+        # initialize gear brand selection
+        st.session_state.gear_brand_selection = st.session_state.get('gear_brand_selection', fn.default_gear_brand_selection(metadata.gear_brands))
+        gear_brand_selection = st.multiselect('Gear Brand', metadata.gear_brands, placeholder='Select Gear Brand', key='gear_brand_selection')
+
+    return year_selection, act_type_selection, gear_brand_selection
+
+def render_page(overview: bool = False) -> Page:
+    '''This function draws the logo, the header, and the filter sidebar shared by every page
+
+    Args:
+        overview (bool): Draw the Overview header, with the Refresh Data button and the data age, instead of a link to it
+
+    Returns:
+        page (Page): Shared data and the filter selections'''
+
+    st.logo(SIDEBAR_LOGO)
+
+    # header
+    with st.container():
+        st.image(TITLE_LOGO)
+        st.subheader('Strava Data Analysis')
+
+        if overview:
+            render_refresh_button()
+        else:
+            st.page_link('Overview.py', label='Refresh Data', help='Refresh data on Overview tab')
+
+        # loads the data on the first run and remembers the version this session shows
+        dataset = fn.get_dataset()
+        metadata = dataset.metadata
+
+        fn.show_refresh_status()
+
+        if overview:
+            render_freshness(metadata.refresh_date)
+
+        st.caption('Last Refreshed: ' + metadata.refresh_date)
+        st.caption('Last Activity Date: ' + metadata.max_date.strftime('%Y-%m-%d %I:%M %p'))
+        st.divider()
+
+    year_selection, act_type_selection, gear_brand_selection = render_filters(metadata)
+
+    return Page(dataset.df, year_selection, act_type_selection, gear_brand_selection, metadata.rolling_12_months, dataset)
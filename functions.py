@@ -1,109 +1,778 @@
+import os
+import json
+import time
+import functools
+import io
+import shutil
+import asyncio
+import aiohttp
 import requests
-import urllib3
+import threading
+import contextlib
+import cachetools
 import streamlit as st
 import pandas as pd
 import warnings
 import numpy as np
 import supabase as sb
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import plotly.graph_objects as go
+import psycopg2
 
-from meteostat import Point, Hourly, units
+from meteostat import Stations, Hourly, units
+from scipy.spatial import cKDTree
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from psycopg2 import sql
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 
 ##### STRAVA API DATA EXTRACTION ####
-# Disable SSL warnings
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+class StravaClient:
+    '''This class sends requests to the Strava API. It keeps one pooled session open so connections are reused, retries rate
+    limited and failed requests with backoff, and only refreshes the access token when it is about to expire.
+    
+    Args:
+        client_id (str): Strava API Application client id
+        client_secret (str): Strava API Application client secret
+        refresh_token (str): Refresh token with read_all and activity:read_all scope
+        max_retries (int): Number of times to retry a request on 429 and 5xx responses
+        backoff_factor (float): Seconds to wait before the first retry, doubled after each one
+        pool_size (int): Number of connections to keep open'''
+    
+    api_url = 'https://www.strava.com/api/v3'
+    auth_url = 'https://www.strava.com/oauth/token'
+    
+    def __init__(self, client_id: str, client_secret: str, refresh_token: str, max_retries: int = 3, backoff_factor: float = 1, pool_size: int = 10):
+        
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        
+        # retry on rate limits and server errors, waiting as long as Strava asks to
+        retries = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET', 'POST'],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        
+        self._access_token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        
+    def get_access_token(self) -> str:
+        '''This function returns the cached access token, refreshing it first if it expires within the next minute
+        
+        Returns:
+            access_token (str): Strava access token'''
+        
+        with self._lock:
+            if self._access_token is None or time.time() >= self._expires_at - 60:
+                self._refresh_access_token()
+            return self._access_token
+        
+    def _refresh_access_token(self) -> None:
+        
+        payload = {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            'refresh_token': self.refresh_token,
+            'grant_type': 'refresh_token',
+            'f': 'json'
+        }
+        
+        response = self.session.post(self.auth_url, data=payload, timeout=30)
+        response.raise_for_status()
+        token = response.json()
+        
+        self._access_token = token['access_token']
+        self._expires_at = token['expires_at']
+        # Strava may hand out a new refresh token
+        self.refresh_token = token.get('refresh_token', self.refresh_token)
+        
+    @property
+    def headers(self) -> dict:
+        return {'Authorization': 'Bearer ' + self.get_access_token()}
+    
+    def get(self, path: str, **kwargs) -> requests.Response:
+        '''This function sends a GET request to the Strava API
+        
+        Args:
+            path (str): API path, such as /athlete/activities
+            **kwargs: Passed on to requests, such as params
+            
+        Returns:
+            response (Response): Successful response'''
+        
+        kwargs.setdefault('timeout', 30)
+        response = self.session.get(self.api_url + path, headers=self.headers, **kwargs)
+        
+        # the token was revoked before it expired, so get a new one and try again
+        if response.status_code == 401:
+            with self._lock:
+                self._access_token = None
+            response = self.session.get(self.api_url + path, headers=self.headers, **kwargs)
+            
+        response.raise_for_status()
+        return response
 
-auth_url = 'https://www.strava.com/oauth/token'
+def get_secret(name: str) -> str:
+    '''This function reads a secret from an environment variable of the same name in upper case, such as CLIENT_ID, and falls
+    back to the Streamlit secrets file. Scheduled syncs can then run without a secrets file
+    
+    Args:
+        name (str): Secret name as written in .streamlit/secrets.toml
+        
+    Returns:
+        value (str): Secret value'''
+    
+    value = os.environ.get(name.upper())
+    if value is not None:
+        return value
+    
+    return st.secrets[name]
 
-payload = {
-    'client_id': st.secrets['client_id'],
-    'client_secret': st.secrets['client_secret'],
-    'refresh_token': st.secrets['refresh_token'],
-    'grant_type': 'refresh_token',
-    'f': 'json'
-}
+@st.cache_resource
+def get_strava_client() -> StravaClient:
+    '''This function creates one Strava client that is shared by every session of the app
+    
+    Returns:
+        client (StravaClient): Strava API client'''
+    
+    return StravaClient(get_secret('client_id'), get_secret('client_secret'), get_secret('refresh_token'))
 
-res = requests.post(auth_url, data=payload, verify=False)
-access_token = res.json()['access_token']
+# local cache for data that rarely changes between refreshes
+DATA_DIR = 'data'
+GEAR_CACHE_PATH = os.path.join(DATA_DIR, 'gear_cache.json')
+# gear details are re-fetched at least once a week
+GEAR_CACHE_TTL = 7 * 24 * 60 * 60
+WEATHER_CACHE_PATH = os.path.join(DATA_DIR, 'weather_cache.parquet')
+# columns the app reads from the database. Date parts are derived again after loading
+APP_COLUMNS = [
+    'id_activity', 'upload_id', 'name_activity', 'type', 'start_date', 'start_date_local', 'moving_time', 'elapsed_time',
+    'distance_activity', 'total_elevation_gain', 'elev_high', 'elev_low', 'average_speed', 'max_speed', 'average_heartrate',
+    'max_heartrate', 'suffer_score', 'temp', 'rhum', 'gear_id', 'name_gear', 'brand_name', 'retired', 'refresh_date'
+]
 
-header = {'Authorization': 'Bearer ' + access_token}
+# columnar copy of the cleaned data for fast app start up
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'snapshot')
+# nearest weather stations to consider for each activity, and how far away they can be in km
+WEATHER_STATION_CANDIDATES = 3
+WEATHER_STATION_RADIUS = 50
+# Meteostat can take a few days to publish recent hours
+WEATHER_CACHE_LAG = pd.Timedelta(days=7)
+# held while a sync runs so the app and scheduled syncs never overlap
+SYNC_LOCK_PATH = os.path.join(DATA_DIR, 'sync.lock')
 
-def get_strava_data() -> pd.DataFrame:
-    '''This function builds the dataframe from Strava API data. It is used to then cache the dataframe for faster loading in the Streamlit app.
+def load_gear_cache(path: str = GEAR_CACHE_PATH) -> dict:
+    '''This function loads the local gear cache
     
+    Args:
+        path (str): Location of the gear cache file
+        
     Returns:
-        pre_df (DataFrame): DataFrame of activities and gear data'''
+        cache (dict): Gear JSON and the time it was fetched, keyed by gear id'''
+    
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_gear_cache(cache: dict, path: str = GEAR_CACHE_PATH) -> None:
+    '''This function writes the gear cache to disk. It writes to a temporary file first so a failed write cannot corrupt the cache
+    
+    Args:
+        cache (dict): Gear JSON and the time it was fetched, keyed by gear id
+        path (str): Location of the gear cache file'''
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(cache, file)
+    os.replace(tmp_path, path)
+
+def load_weather_cache(path: str = WEATHER_CACHE_PATH) -> pd.DataFrame:
+    '''This function loads the local weather cache
     
-    with st.status('Downloading Data...', expanded=True) as status:
+    Args:
+        path (str): Location of the weather cache file
         
-        # Strava API only allows 200 results per page. This function loops through until all results are collected
-        def get_activities_data() -> pd.DataFrame:
-            '''This function gets all activities data from Strava API
-            
-            Returns:
-                data (DataFrame): Normalized JSON data of activities'''
-                
-            # set the URL for the Strava API
-            activities_url = 'https://www.strava.com/api/v3/athlete/activities'
-            # set value of page to start at page 1
-            page = 1
-            # create an empty list to store all data
-            data = []
-            # set new_results to True to start the loop
-            new_results = True
-            
-            st.write('Fetching Activities...')
-            
-            for page in range(1, 21):
-                try:
-                    response = requests.get(
-                        activities_url,
-                        headers=header,
-                        params={'per_page': 200, 'page': page},
-                        timeout=30,
-                    )
-                    response.raise_for_status()
-                    get_activities = response.json()
-                except Exception as exc:
-                    print(f"Strava request failed: {exc}")
-                    return pd.DataFrame()
+    Returns:
+        cache (DataFrame): Temperature and relative humidity by weather station and UTC hour'''
+    
+    columns = ['station', 'hour', 'temp', 'rhum']
+    
+    try:
+        cache = pd.read_parquet(path)
+        return cache[columns]
+    except Exception:
+        # missing, unreadable, or written before the cache was keyed by station
+        return pd.DataFrame({'station': pd.Series(dtype=object), 'hour': pd.Series(dtype='datetime64[ns]'),
+                             'temp': pd.Series(dtype=float), 'rhum': pd.Series(dtype=float)})
 
-                # feedback
-                print(f"Fetching page {page}")
+def save_weather_cache(cache: pd.DataFrame, path: str = WEATHER_CACHE_PATH) -> None:
+    '''This function writes the weather cache to disk
+    
+    Args:
+        cache (DataFrame): Temperature and relative humidity by weather station and UTC hour
+        path (str): Location of the weather cache file'''
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    cache = cache.drop_duplicates(subset=['station', 'hour'], keep='last')
+    
+    tmp_path = path + '.tmp'
+    cache.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
 
-                if isinstance(get_activities, dict) and 'errors' in get_activities:
-                    print(f"Strava API error: {get_activities['errors']}")
-                    break
+def to_unit_vectors(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    '''This function converts latitude and longitude to points on the unit sphere, so straight line distance ranks the same as
+    distance along the earth
+    
+    Args:
+        lat (array): Latitudes in degrees
+        lon (array): Longitudes in degrees
+        
+    Returns:
+        array: x, y, z coordinates with one row per point'''
+    
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+@functools.lru_cache(maxsize=1)
+def get_station_index() -> tuple:
+    '''This function builds a KD-tree of every Meteostat station with hourly data. It is built once per process
+    
+    Returns:
+        stations (DataFrame): Station ids with the first and last day of hourly data
+        tree (cKDTree): KD-tree of the station locations'''
+    
+    stations = Stations().fetch()
+    stations = stations.loc[stations['hourly_start'].notna(), ['latitude', 'longitude', 'hourly_start', 'hourly_end']]
+    
+    tree = cKDTree(to_unit_vectors(stations['latitude'], stations['longitude']))
+    
+    return stations, tree
+
+def find_weather_stations(lat: np.ndarray, lon: np.ndarray, start: np.ndarray, k: int = WEATHER_STATION_CANDIDATES,
+                          max_distance: float = WEATHER_STATION_RADIUS) -> np.ndarray:
+    '''This function finds the nearest weather station with hourly data at the time of each activity in one vectorized query
+    
+    Args:
+        lat (array): Start latitude of each activity
+        lon (array): Start longitude of each activity
+        start (array): Start time of each activity in UTC
+        k (int): Number of nearby stations to consider, in order of distance
+        max_distance (float): Furthest a station can be in km
+        
+    Returns:
+        array: Station id for each activity, or None if no station is close enough or the stations could not be loaded'''
+    
+    n = len(lat)
+    
+    if n == 0:
+        return np.array([], dtype=object)
+    
+    # without stations the activities are kept with no weather, the same as a failed weather request
+    try:
+        stations, tree = get_station_index()
+    except Exception as exc:
+        print(f"Error fetching weather stations: {exc}")
+        return np.full(n, None, dtype=object)
+    
+    # straight line distance through the unit sphere for an arc of max_distance
+    max_chord = 2 * np.sin(max_distance / 6371 / 2)
+    _, idx = tree.query(to_unit_vectors(lat, lon), k=k, distance_upper_bound=max_chord)
+    idx = np.asarray(idx).reshape(n, k)
+    
+    # missing neighbours come back as the number of stations
+    found = idx < len(stations)
+    idx = np.where(found, idx, 0)
+    
+    # skip stations without hourly data for the time of the activity
+    start = np.asarray(start, dtype='datetime64[ns]')[:, None]
+    hourly_start = stations['hourly_start'].to_numpy(dtype='datetime64[ns]')[idx]
+    hourly_end = stations['hourly_end'].to_numpy(dtype='datetime64[ns]')[idx]
+    covered = found & (hourly_start <= start) & (np.isnat(hourly_end) | (start <= hourly_end + WEATHER_CACHE_LAG.to_timedelta64()))
+    
+    first = covered.argmax(axis=1)
+    rows = np.arange(n)
+    
+    return np.where(covered[rows, first], stations.index.to_numpy()[idx[rows, first]], None)
 
+async def fetch_activity_pages(headers: dict, params: dict, per_page: int = 200, max_in_flight: int = 4) -> pd.DataFrame:
+    '''This function downloads every page of /athlete/activities with several requests in flight at once. The first short or
+    empty page marks the end of the data, requests past it are cancelled, and each page is normalized as soon as it arrives.
+    
+    Args:
+        headers (dict): Authorization header for the Strava API
+        params (dict): Extra query parameters, such as after
+        per_page (int): Number of activities per page. Strava allows up to 200
+        max_in_flight (int): Number of page requests to run at the same time
+        
+    Returns:
+        data (DataFrame): Normalized JSON data of activities in page order'''
+    
+    activities_url = 'https://www.strava.com/api/v3/athlete/activities'
+    
+    async def get_page(session: aiohttp.ClientSession, page: int, max_retries: int = 3) -> list:
+        for attempt in range(max_retries + 1):
+            async with session.get(activities_url, params={**params, 'per_page': per_page, 'page': page}) as response:
+                # back off on rate limits and server errors, the same way StravaClient does
+                if response.status in (429, 500, 502, 503, 504) and attempt < max_retries:
+                    await asyncio.sleep(float(response.headers.get('Retry-After', 2 ** attempt)))
+                    continue
+                response.raise_for_status()
+                return await response.json()
+    
+    # normalized pages keyed by page number so they can be put back in order
+    pages = {}
+    # last page is unknown until a short or empty page comes back
+    last_page = None
+    next_page = 1
+    in_flight = {}
+    
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+        
+        while True:
+            # keep the pipeline full until the last page is known
+            while len(in_flight) < max_in_flight and last_page is None:
+                in_flight[asyncio.create_task(get_page(session, next_page))] = next_page
+                next_page += 1
+                
+            if not in_flight:
+                break
+            
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in done:
+                page = in_flight.pop(task)
+                get_activities = task.result()
+                
                 if not isinstance(get_activities, list):
                     print(f"Unexpected Strava response format: {type(get_activities).__name__}")
-                    break
+                    get_activities = []
+                
+                # feedback
+                print(f"Fetched page {page}: {len(get_activities)} activities")
+                
+                if len(get_activities) < per_page:
+                    last_page = page if last_page is None else min(last_page, page)
+                
+                if get_activities:
+                    pages[page] = pd.json_normalize(get_activities)
+            
+            # anything requested past the last page is empty, so stop waiting for it
+            if last_page is not None:
+                cancelled = [task for task, page in in_flight.items() if page > last_page]
+                for task in cancelled:
+                    task.cancel()
+                    del in_flight[task]
+                await asyncio.gather(*cancelled, return_exceptions=True)
+    
+    frames = [pages[page] for page in sorted(pages) if last_page is None or page <= last_page]
+    
+    if not frames:
+        return pd.DataFrame()
+    
+    return pd.concat(frames, ignore_index=True)
 
-                print(f"Number of activities fetched: {len(get_activities)}")
+def get_sync_watermark(df: pd.DataFrame) -> int | None:
+    '''This function finds the latest start_date already stored so only newer activities are requested from Strava
+    
+    Args:
+        df (DataFrame): Stored activities data
+        
+    Returns:
+        int: Unix timestamp of the latest stored activity, or None if there is nothing stored'''
+    
+    if df is None or df.empty or 'start_date' not in df.columns:
+        return None
+    
+    latest = pd.to_datetime(df['start_date']).max()
+    
+    if pd.isnull(latest):
+        return None
+    
+    # start_date is stored in UTC without a timezone
+    if latest.tzinfo is None:
+        latest = latest.tz_localize('UTC')
+    
+    return int(latest.timestamp())
 
-                if not get_activities:
-                    break
+def merge_activities(existing_df: pd.DataFrame, new_df: pd.DataFrame, gear_columns: list) -> pd.DataFrame:
+    '''This function merges newly synced activities into the stored dataset by id_activity
+    
+    Args:
+        existing_df (DataFrame): Stored activities data
+        new_df (DataFrame): Newly downloaded and enriched activities
+        gear_columns (list): Columns that came from the gear data
+        
+    Returns:
+        df (DataFrame): Stored activities with new and changed activities replaced'''
+    
+    # new rows replace stored rows with the same id
+    existing_df = existing_df[~existing_df['id_activity'].isin(new_df['id_activity'])].copy()
+    
+    # gear details like total distance change with every new activity, so update them on older activities too
+    gear_columns = [col for col in gear_columns if col in existing_df.columns and col in new_df.columns]
+    if gear_columns and not new_df['gear_id'].dropna().empty:
+        latest_gear = new_df.dropna(subset=['gear_id']).drop_duplicates('gear_id', keep='last').set_index('gear_id')[gear_columns]
+        mask = existing_df['gear_id'].isin(latest_gear.index)
+        existing_df.loc[mask, gear_columns] = latest_gear.loc[existing_df.loc[mask, 'gear_id'], gear_columns].to_numpy()
+    
+    df = pd.concat([existing_df, new_df], ignore_index=True)
+    
+    return df.sort_values(by='start_date').reset_index(drop=True)
 
-                data.extend(get_activities)
+##### PROGRESS REPORTING #####
+# get_strava_data reports progress through a reporter with the same methods as st.status: start, write, progress, and update
+class StreamlitReporter:
+    '''Shows sync progress in the page with st.status. Only usable from the script thread'''
 
-            print('Stopping after 20 pages to avoid excessive API calls.')
-            return pd.json_normalize(data)
+    def start(self, label: str) -> 'StreamlitReporter':
+        self._status = st.status(label, expanded=True)
+        self._progress_bar = None
+        return self
+
+    def __enter__(self) -> 'StreamlitReporter':
+        self._status.__enter__()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return self._status.__exit__(*exc)
+
+    def write(self, message: str) -> None:
+        self._status.write(message)
+
+    def progress(self, value: float) -> None:
+        if self._progress_bar is None:
+            self._progress_bar = self._status.progress(value)
+        else:
+            self._progress_bar.progress(value)
+
+    def update(self, label: str, state: str = 'complete') -> None:
+        self._status.update(label=label, state=state, expanded=False)
+
+class RefreshStatus:
+    '''Records sync progress so it can be read from other threads. Used by the background refresh, where st calls are not allowed'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.label = None
+            self.state = 'idle'
+            self.messages = []
+            self.progress_value = None
+            self.started_at = None
+            self.finished_at = None
+
+    def start(self, label: str) -> 'RefreshStatus':
+        with self._lock:
+            self.label = label
+            self.state = 'running'
+            self.started_at = self.started_at or time.time()
+        return self
+
+    def __enter__(self) -> 'RefreshStatus':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is not None:
+            self.update(f'Refresh failed: {exc}', state='error')
+        return False
+
+    def write(self, message: str) -> None:
+        with self._lock:
+            self.messages.append(message)
+
+    def progress(self, value: float) -> None:
+        with self._lock:
+            self.progress_value = value
+
+    def update(self, label: str, state: str = 'complete') -> None:
+        with self._lock:
+            self.label = label
+            self.state = state
+            if state != 'running':
+                self.finished_at = time.time()
+
+    def snapshot(self) -> dict:
+        '''This function returns a consistent copy of the status for pages to render
+
+        Returns:
+            status (dict): Label, state, messages, progress, and start and finish times'''
+
+        with self._lock:
+            return {'label': self.label, 'state': self.state, 'messages': list(self.messages), 'progress': self.progress_value,
+                    'started_at': self.started_at, 'finished_at': self.finished_at}
+
+class ConsoleReporter:
+    '''Prints sync progress with timestamps. Used by the command line sync'''
+
+    def __init__(self, progress_step: float = 0.25):
+        # only print progress every time another quarter is done
+        self.progress_step = progress_step
+
+    def _print(self, message: str) -> None:
+        print(f"[{pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+    def start(self, label: str) -> 'ConsoleReporter':
+        self._next_progress = 0
+        self._print(label)
+        return self
+
+    def __enter__(self) -> 'ConsoleReporter':
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def write(self, message: str) -> None:
+        self._print(message)
+
+    def progress(self, value: float) -> None:
+        if value >= self._next_progress:
+            self._print(f'{value:.0%} done')
+            self._next_progress = value + self.progress_step
+
+    def update(self, label: str, state: str = 'complete') -> None:
+        self._print(label)
+
+class SyncLocked(RuntimeError):
+    '''Raised when another sync already holds the lock file'''
+
+@contextlib.contextmanager
+def sync_lock(path: str = SYNC_LOCK_PATH):
+    '''This function holds a lock file while a sync runs, so syncs from the app and from the command line never overlap. A lock
+    left behind by a process that no longer exists is removed
+
+    Args:
+        path (str): Location of the lock file'''
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def is_stale() -> bool:
+        try:
+            with open(path) as file:
+                pid = int(file.read().strip())
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except (FileNotFoundError, ValueError):
+            # the lock was just released, or is being written
+            return False
+        except PermissionError:
+            # the process exists but belongs to another user
+            return False
+        return False
+
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if not is_stale():
+            raise SyncLocked(f'Another sync is running. Remove {path} if it is not')
+        print(f"Removing stale sync lock {path}")
+        os.remove(path)
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+
+    with os.fdopen(fd, 'w') as file:
+        file.write(str(os.getpid()))
+
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+##### DATA TRANSFORMATION #####
+WEEKDAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], dtype=object)
+MONTH_NAMES = np.array(['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October', 'November', 'December'], dtype=object)
+# 12 hour label for every minute of the day, e.g. 06:05 AM
+TIME_12H_LABELS = np.array([f"{(minute // 60 + 11) % 12 + 1:02d}:{minute % 60:02d} {'AM' if minute < 720 else 'PM'}" for minute in range(1440)], dtype=object)
+
+def parse_timestamp(col: pd.Series) -> pd.Series:
+    '''This function parses a timestamp column once. The timezone is dropped (the wall clock time is kept) along with anything
+    smaller than a second. Columns that are already datetimes are not parsed again
+    
+    Args:
+        col (Series): ISO 8601 strings or datetimes
+        
+    Returns:
+        col (Series): datetime64 column without a timezone'''
+    
+    if not pd.api.types.is_datetime64_any_dtype(col):
+        col = pd.to_datetime(col, format='ISO8601')
+    
+    if col.dt.tz is not None:
+        col = col.dt.tz_localize(None)
+    
+    return col.dt.floor('s')
+
+def parse_duration(col: pd.Series) -> pd.Series:
+    '''This function converts a duration column to timedeltas. Strava sends durations in seconds, and the database stores them
+    as strings like 0 days 01:02:03
+    
+    Args:
+        col (Series): Seconds, strings, or timedeltas
+        
+    Returns:
+        col (Series): timedelta64 column'''
+    
+    if pd.api.types.is_timedelta64_dtype(col):
+        return col
+    
+    if pd.api.types.is_numeric_dtype(col):
+        return pd.to_timedelta(col, unit='s')
+    
+    return pd.to_timedelta(col)
+
+def add_date_columns(df: pd.DataFrame) -> pd.DataFrame:
+    '''This function derives the date parts used across the app from start_date_local with vectorized datetime operations
+    
+    Args:
+        df (DataFrame): Activities with a parsed start_date_local
+        
+    Returns:
+        df (DataFrame): Activities with time of day, weekday, month, and year columns'''
+    
+    local = df['start_date_local']
+    month_num = local.dt.month.to_numpy()
+    
+    # add start time for analysis and in am/pm format
+    df['start_time_local_24h'] = local.dt.time
+    df['start_time_local_24h_hour'] = local.dt.round('h').dt.hour
+    df['start_time_local_12h'] = TIME_12H_LABELS[(local.dt.hour * 60 + local.dt.minute).to_numpy()]
+    
+    # add day of week
+    df['weekday_num'] = local.dt.weekday
+    df['weekday'] = WEEKDAY_NAMES[df['weekday_num'].to_numpy()]
+    
+    # add month, with monthly_date on a single year so months line up across years
+    df['month_num'] = month_num
+    df['month'] = MONTH_NAMES[month_num - 1]
+    df['monthly_date'] = (np.datetime64('2025-01', 'M') + (month_num - 1)).astype('datetime64[ns]')
+    
+    # add month year
+    df['month_year'] = local.to_numpy().astype('datetime64[M]').astype('datetime64[ns]')
+    
+    # add month year name, formatting each distinct month once
+    codes, months = pd.factorize(df['month_year'])
+    df['month_year_name'] = months.strftime('%b %Y').to_numpy(dtype=object)[codes]
+    
+    # add year label
+    df['year'] = local.dt.year
+    
+    return df
+
+def transform_activities(df: pd.DataFrame) -> pd.DataFrame:
+    '''This function is the single transform stage for activities, whether they come from Strava, the database, or the session.
+    Each timestamp is parsed once and every date part is derived from it
+    
+    Args:
+        df (DataFrame): Activities data
+        
+    Returns:
+        df (DataFrame): Activities with typed durations, timestamps, and date parts'''
+    
+    # durations straight from seconds, so activities over 24 hours do not wrap around
+    df['moving_time'] = parse_duration(df['moving_time'])
+    df['elapsed_time'] = parse_duration(df['elapsed_time'])
+    
+    # convert start_date and start_date_local to datetime
+    df['start_date'] = parse_timestamp(df['start_date'])
+    df['start_date_local'] = parse_timestamp(df['start_date_local'])
+    
+    return add_date_columns(df)
+
+def get_strava_data(existing_df: pd.DataFrame | None = None, average_weather: bool = False, reporter=None) -> pd.DataFrame:
+    '''This function builds the dataframe from Strava API data. It is used to then cache the dataframe for faster loading in the Streamlit app.
+    
+    When existing_df is passed, the sync is incremental: only activities that started after the latest stored start_date are
+    downloaded and enriched, then merged into existing_df by id_activity.
+    
+    Args:
+        existing_df (DataFrame): Activities data already stored. Leave empty for a full download
+        average_weather (bool): Average temperature and humidity over the whole activity instead of the hour it started
+        reporter (object): Where progress is reported, such as a RefreshStatus. Defaults to st.status in the page
+    
+    Returns:
+        pre_df (DataFrame): DataFrame of activities and gear data'''
+    
+    after = get_sync_watermark(existing_df)
+    incremental = after is not None
+    
+    with (reporter or StreamlitReporter()).start('Downloading Data...') as status:
+        
+        # Strava API only allows 200 results per page. Pages are requested concurrently until the last one is found
+        def get_activities_data(after: int | None = None) -> pd.DataFrame | None:
+            '''This function gets all activities data from Strava API
+            
+            Args:
+                after (int): Only return activities that started after this unix timestamp
+            
+            Returns:
+                data (DataFrame): Normalized JSON data of activities, or None if the request failed'''
+            
+            params = {}
+            if after is not None:
+                params['after'] = after
+            
+            status.write('Fetching Activities...')
+            
+            try:
+                return asyncio.run(fetch_activity_pages(get_strava_client().headers, params))
+            except Exception as exc:
+                print(f"Strava request failed: {exc}")
+                return None
               
-        # get all activities data
-        activities = get_activities_data()
+        # get all activities data, or only the new ones when syncing incrementally
+        activities = get_activities_data(after)
         
-        if activities.empty: 
+        if activities is not None and activities.empty and incremental:
             
-            status.update(label='Cannot refresh. Data loaded from backup!', state='complete', expanded=False)
+            status.update('No new activities. Data is up to date!')
+            
+            existing_df = existing_df.copy()
+            existing_df['refresh_date'] = pd.Timestamp.now(tz='America/New_York').strftime('%Y-%m-%d %I:%M %p')
+            return existing_df
+        
+        if activities is None or activities.empty: 
+            
+            status.update('Cannot refresh. Data loaded from backup!')
+            
+            if incremental:
+                return existing_df
             
             try:
-                return get_data_from_database()
+                return get_data_from_database(columns=None)
             except Exception as exc:
                 print(f"Fallback to database failed: {exc}")
                 return pd.DataFrame()
         
+        status.write(f'Found {len(activities)} new activities...' if incremental else f'Found {len(activities)} activities...')
+        
         # convert meters to miles
         activities.distance = (activities.distance / 1609.34).round(2)
         # convert to mph
@@ -116,102 +785,192 @@ def get_strava_data() -> pd.DataFrame:
 
         activities_df = pd.DataFrame(activities)
         
-        def add_weather_data(df: pd.DataFrame, max_workers=30) -> pd.DataFrame:
-            '''This function gets weather data from Meteostat and adds it onto the activities DataFrame
+        def add_weather_data(df: pd.DataFrame, max_workers=30, average_over_activity=False) -> pd.DataFrame:
+            '''This function gets weather data from Meteostat and adds it onto the activities DataFrame. Each activity is matched
+            to its nearest weather station, one hourly range is fetched per station for the hours missing from the local weather
+            cache, and the weather is joined onto the activities by timestamp. Activities without a start location are skipped
             
             Args:
                 df (DataFrame): Activities data frame that uses latitude, longitude, and timestamps to get weather data
                 max_worker (int): Number of threads to use in the multi-threading process
+                average_over_activity (bool): Average the weather over every hour of the activity instead of the hour it started
                 
             Returns:
                 df (DataFrame): Original df with weatehr data appended'''
                 
-            def get_weather(row):
-                '''This function takes the latitude, longitude, and timestamp for each row and calls the Meteostat API for data
+            def get_weather(station):
+                '''This function calls the Meteostat API once for a weather station, covering every hour it is missing
                 
                 Args:
-                    row: The row in the DataFrame used in the parent function
+                    station (tuple): Station id and the DataFrame of hours needed from that station
                     
                 Returns:
-                    weather_data (dict): The temperature and relative humidity of the row's activity as a dictionary'''
+                    weather_data (DataFrame): The temperature and relative humidity for each needed hour of the station'''
                 
-                # get the location of the activity
-                location = Point(row['start_latitude'], row['start_longitude'])
-                # get the time of the activity
-                timestamp = pd.to_datetime(row['start_date_local'])
-                # only use the hour it started
-                start = end = timestamp.replace(tzinfo=None, minute=0, second=0, microsecond=0)
+                station_id, hours = station
+                weather_data = hours.assign(temp=np.nan, rhum=np.nan)
 
                 # call meteostat API
                 try:
-                    data = Hourly(location, start, end)
+                    data = Hourly(station_id, hours['hour'].min(), hours['hour'].max())
                     data = data.convert(units.imperial).fetch()
                     if not data.empty:
-                        # only get the first row of data
-                        weather = data[['temp', 'rhum']].iloc[0]
-                        return {'temp': weather['temp'], 'rhum': weather['rhum']}
-                    else:
-                        return {'temp': None, 'rhum': None}
+                        # only keep the hours that activities need
+                        weather = data[['temp', 'rhum']].reindex(hours['hour']).to_numpy()
+                        weather_data[['temp', 'rhum']] = weather
                 except Exception as e:
-                    print(f"Error fetching weather for {timestamp}: {e}")
-                    return {'temp': None, 'rhum': None}
+                    print(f"Error fetching weather for station {station_id}: {e}")
                 
+                return weather_data
+            
+            df = df.reset_index(drop=True)
+            df['start_hour'] = pd.to_datetime(df['start_date'], utc=True).dt.tz_localize(None)
+            
+            # indoor and treadmill activities have no start location
+            located = (df['start_latlng'].str.len() == 2).fillna(False).astype(bool)
+            
             # separate the latitude and longitude from the activity data
-            df[['start_latitude', 'start_longitude']] = pd.DataFrame(df['start_latlng'].tolist(), index=df.index)
+            latlng = np.array(df.loc[located, 'start_latlng'].tolist(), dtype=float).reshape(-1, 2)
+            df['start_latitude'] = np.nan
+            df['start_longitude'] = np.nan
+            df.loc[located, 'start_latitude'] = latlng[:, 0]
+            df.loc[located, 'start_longitude'] = latlng[:, 1]
             
-            # Prepare rows
-            rows = [row for _, row in df.iterrows()]
-            max_rows = len(rows)
-
-            progress_bar = st.progress(0)
+            # match every located activity to a weather station in one query
+            df['station'] = None
+            df.loc[located, 'station'] = find_weather_stations(latlng[:, 0], latlng[:, 1], df.loc[located, 'start_hour'].to_numpy())
+            located = df['station'].notna()
+            
+            first_hour = df['start_hour'].dt.floor('h')
+            if average_over_activity:
+                last_hour = (df['start_hour'] + pd.to_timedelta(df['elapsed_time'], unit='s')).dt.floor('h')
+            else:
+                last_hour = first_hour
+            
+            # one row per activity and hour it covers
+            n_hours = ((last_hour - first_hour) // pd.Timedelta(hours=1) + 1)[located].to_numpy()
+            activity_hours = pd.DataFrame({
+                'activity': np.repeat(df.index[located], n_hours),
+                'station': np.repeat(df.loc[located, 'station'].to_numpy(), n_hours),
+                'hour': np.repeat(first_hour[located].to_numpy(), n_hours)
+                        + (np.arange(n_hours.sum()) - np.repeat(np.cumsum(n_hours) - n_hours, n_hours)) * np.timedelta64(1, 'h'),
+            })
+            
+            keys = activity_hours[['station', 'hour']].drop_duplicates()
+            
+            # only ask Meteostat about lookups that have never been seen
+            cache = load_weather_cache()
+            misses = keys.merge(cache[['station', 'hour']], how='left', indicator=True)
+            misses = misses.loc[misses['_merge'] == 'left_only', ['station', 'hour']]
+            
+            # one request per station covering all of its missing hours
+            stations = list(misses.groupby('station'))
+            
+            print(f"Weather cache: {len(keys) - len(misses)} hits, {len(misses)} to fetch from {len(stations)} stations")
+            
+            if stations:
+                
+                status.progress(0)
 
-            # multi-threading so the function can call the API and iterate through rows faster
-            weather_data = []
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                for i, result in enumerate(executor.map(get_weather, rows)):
-                    weather_data.append(result)
-                    progress_bar.progress((i + 1) / max_rows)
+                # multi-threading so the function can call the API and iterate through stations faster
+                weather_data = []
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    for i, result in enumerate(executor.map(get_weather, stations)):
+                        weather_data.append(result)
+                        status.progress((i + 1) / len(stations))
+                
+                fetched = pd.concat(weather_data, ignore_index=True).astype({'temp': float, 'rhum': float})
+                # recent hours may not be published yet, so only remember empty results for older hours
+                fetched = fetched[fetched['temp'].notna() | (fetched['hour'] < pd.Timestamp.utcnow().tz_localize(None) - WEATHER_CACHE_LAG)]
+                cache = pd.concat([cache, fetched], ignore_index=True)
+                save_weather_cache(cache)
+                Hourly.clear_cache()
 
-            # get the weatehr data and concat the two DataFrames
-            weather_df = pd.DataFrame(weather_data)
-            Hourly.clear_cache()
-            return pd.concat([df.reset_index(drop=True), weather_df.reset_index(drop=True)], axis=1)
+            # get the weatehr data and join it onto the activities
+            if average_over_activity:
+                weather = activity_hours.merge(cache, how='left', on=['station', 'hour']).groupby('activity')[['temp', 'rhum']].mean()
+                df = df.join(weather)
+            else:
+                # latest observation at or before the start of each activity from the same station
+                weather = cache.rename(columns={'hour': 'weather_hour'}).dropna(subset=['temp', 'rhum'], how='all').sort_values('weather_hour')
+                located_df = df[located].sort_values('start_hour')
+                located_df = pd.merge_asof(located_df, weather, left_on='start_hour', right_on='weather_hour', by='station',
+                                           direction='backward', tolerance=pd.Timedelta(hours=1)).set_index(located_df.index)
+                df = pd.concat([located_df.drop(columns='weather_hour'), df[~located]]).sort_index()
+            
+            return df.drop(columns=['station', 'start_hour'])
         
-        st.write('Sprinkling in Weather Data...')
+        status.write('Sprinkling in Weather Data...')
         
-        activities_df = add_weather_data(activities_df)
+        activities_df = add_weather_data(activities_df, average_over_activity=average_weather)
 
         # get distinct gear id's
         gear_id_list = activities_df['gear_id'].unique()
         gear_id_list = gear_id_list[~pd.isnull(gear_id_list)]
 
-        def get_gear_data(gear_list: list) -> pd.DataFrame:
-            '''This function gets gear data from Strava API
+        def get_gear_data(gear_list: list, last_used: pd.Series, max_workers=8) -> pd.DataFrame:
+            '''This function gets gear data from the local gear cache, and from Strava API for gear that is missing, expired, or
+            used by an activity that finished after it was cached (its distance has changed)
             
             Args:
                 gear_list (array): List of distinct gear ids
+                last_used (Series): Unix timestamp of the latest activity end for each gear id
+                max_workers (int): Number of threads to use when fetching gear from Strava
                 
-                Returns:
-                    data (DataFrame): Normalized JSON data of gear'''
-            # set the URL for the Strava API
-            gear_url = 'https://www.strava.com/api/v3/gear/{id}'
-            # create empty list to store gear data
-            data = []
-            # loop through gear_list and get gear data
-            for gear_id in gear_list:
-                get_gear = requests.get(gear_url.format(id=gear_id), headers=header).json()
-                data.append(get_gear)
-            return pd.json_normalize(data)
-
-        st.write('Appending Gear Data...')
-        
-        # get all gear data
-        gear = get_gear_data(gear_id_list)
+            Returns:
+                data (DataFrame): Normalized JSON data of gear'''
+            # set the path for the Strava API
+            gear_path = '/gear/{id}'
+            client = get_strava_client()
+            
+            cache = load_gear_cache()
+            now = time.time()
+            
+            def is_stale(gear_id) -> bool:
+                entry = cache.get(gear_id)
+                if entry is None or now - entry['fetched_at'] > GEAR_CACHE_TTL:
+                    return True
+                return last_used.get(gear_id, 0) > entry['fetched_at']
+            
+            def fetch_gear(gear_id):
+                try:
+                    return gear_id, client.get(gear_path.format(id=gear_id)).json()
+                except Exception as exc:
+                    print(f"Error fetching gear {gear_id}: {exc}")
+                    return gear_id, None
+            
+            misses = [gear_id for gear_id in gear_list if is_stale(gear_id)]
+            print(f"Gear cache: {len(gear_list) - len(misses)} hits, {len(misses)} to fetch")
+            
+            # multi-threading so all missing gear is fetched at once
+            if misses:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    for gear_id, get_gear in executor.map(fetch_gear, misses):
+                        # keep the stale entry if the request failed
+                        if get_gear is not None:
+                            cache[gear_id] = {'fetched_at': now, 'data': get_gear}
+                save_gear_cache(cache)
+            
+            data = [cache[gear_id]['data'] for gear_id in gear_list if gear_id in cache]
+            return pd.json_normalize(data)
 
-        # convert meters to miles
-        gear.distance = gear.distance / 1609.34
+        status.write('Appending Gear Data...')
+        
+        # latest time each gear was used, so gear with new activities gets a fresh distance
+        activity_end = pd.to_datetime(activities_df['start_date'], utc=True) + pd.to_timedelta(activities_df['elapsed_time'], unit='s')
+        last_used = (activity_end.astype('int64') // 10**9).groupby(activities_df['gear_id']).max()
+        
+        # get all gear data
+        gear = get_gear_data(gear_id_list, last_used)
 
-        gear = gear.drop(columns=['converted_distance'])
+        if gear.empty:
+            # none of the activities have gear
+            gear = pd.DataFrame(columns=['id'])
+        else:
+            # convert meters to miles
+            gear.distance = gear.distance / 1609.34
+
+            gear = gear.drop(columns=['converted_distance'])
 
         ##### DATA CLEANING AND TRANSFORMATION #####
         # create base dataframe joining activity and gear data
@@ -222,166 +981,957 @@ def get_strava_data() -> pd.DataFrame:
                         right_on='id',
                         suffixes=('_activity', '_gear')).drop(columns='id_gear')
 
-        # convert moving_time and elapsed time to H% M% S% format
-        pre_df['moving_time'] = pd.to_timedelta(pd.to_datetime(pre_df['moving_time'], unit='s').dt.strftime('%H:%M:%S'))
-        pre_df['elapsed_time'] = pd.to_timedelta(pd.to_datetime(pre_df['elapsed_time'], unit='s').dt.strftime('%H:%M:%S'))
+        # typed durations, timestamps, and date parts
+        pre_df = transform_activities(pre_df)
+        
+        #add timestamp
+        pre_df['refresh_date'] = pd.Timestamp.now(tz='America/New_York').strftime('%Y-%m-%d %I:%M %p')
+        
+        pre_df.drop(columns=['start_latlng', 'end_latlng', 'start_latitude', 'start_longitude'], inplace=True)
+
+        str_columns = [col for col in pre_df.columns if col.endswith('_str')]
+        if str_columns:
+            pre_df = pre_df.drop(columns=str_columns)
+        
+        # merge the new activities into the stored data
+        if incremental:
+            gear_columns = [col + '_gear' if col + '_gear' in pre_df.columns else col for col in gear.columns if col != 'id']
+            pre_df = merge_activities(existing_df, pre_df, gear_columns)
+            pre_df['refresh_date'] = pd.Timestamp.now(tz='America/New_York').strftime('%Y-%m-%d %I:%M %p')
+    
+        status.update('Data is Served!')
+        
+        return pre_df
+    
+##### DATABASE AND LOCAL SNAPSHOT #####
+@functools.lru_cache(maxsize=1)
+def get_supabase_client() -> sb.Client:
+    '''This function creates one Supabase client per process
+    
+    Returns:
+        client (Client): Supabase client'''
+    
+    return sb.create_client(get_secret('supabase_url'), get_secret('supabase_secret'))
+
+def get_database_version() -> str | None:
+    '''This function reads the version stamp of the data in the database without downloading it. The stamp is the latest refresh
+    date plus the number of rows. Changed rows are written with a new refresh date, so it changes whenever the data does
+    
+    Returns:
+        version (str): Dataset version stamp, or None if the database cannot be reached'''
+    
+    try:
+        response = get_supabase_client().table("tom_runs_the_world").select("refresh_date", count='exact').order('refresh_date', desc=True).limit(1).execute()
+    except Exception as exc:
+        print(f"Could not read dataset version from Supabase: {exc}")
+        return None
+    
+    if not response.data:
+        return None
+    
+    return f"{pd.Timestamp(response.data[0]['refresh_date']).isoformat()}|{response.count}"
+
+def write_snapshot(df: pd.DataFrame, version: str | None, path: str = SNAPSHOT_DIR) -> None:
+    '''This function saves the cleaned DataFrame as a local Arrow IPC snapshot partitioned by year. The new snapshot is
+    written next to the old one and swapped in, so readers never see a half written snapshot
+    
+    Args:
+        df (DataFrame): Cleaned activities data
+        version (str): Dataset version stamp the snapshot was built from
+        path (str): Snapshot folder'''
+    
+    if df.empty or version is None:
+        return
+    
+    tmp_path = path + '.tmp'
+    old_path = path + '.old'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        ds.write_dataset(table, os.path.join(tmp_path, 'data'), format='ipc', partitioning=['year'], partitioning_flavor='hive')
+    except Exception as exc:
+        print(f"Could not write local snapshot: {exc}")
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+    
+    manifest = {
+        'version': version,
+        'columns': df.columns.tolist(),
+        'years': sorted(int(year) for year in df['year'].unique()),
+    }
+    with open(os.path.join(tmp_path, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file)
+    
+    # swap the new snapshot in
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def read_snapshot(version: str | None = None, path: str = SNAPSHOT_DIR) -> pd.DataFrame | None:
+    '''This function loads the whole local snapshot with memory mapping. Every year is read, because the app serves one shared
+    Dataset whose filter options, All, and Rolling 12 Months views span years
+    
+    Args:
+        version (str): Expected dataset version stamp. Leave empty to accept any snapshot
+        path (str): Snapshot folder
+        
+    Returns:
+        df (DataFrame): Cleaned activities data, or None if there is no snapshot for this version'''
+    
+    try:
+        with open(os.path.join(path, 'manifest.json')) as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    
+    if version is not None and manifest['version'] != version:
+        return None
+    
+    try:
+        dataset = ds.dataset(os.path.join(path, 'data'), format='ipc', partitioning='hive', filesystem=pafs.LocalFileSystem(use_mmap=True))
+        table = dataset.to_table()
+    except Exception as exc:
+        print(f"Could not read local snapshot: {exc}")
+        return None
+    
+    df = table.to_pandas()
+    # the year comes back from the folder names, so restore its type and the original column order
+    df['year'] = df['year'].astype('int64')
+    
+    return df[manifest['columns']]
+
+def load_dataset(version: str | None = None) -> pd.DataFrame:
+    '''This function loads the cleaned activities data from the local snapshot when it matches the version in the database,
+    and otherwise downloads it from the database and rewrites the snapshot
+    
+    Args:
+        version (str): Database version stamp, if it was already looked up
+    
+    Returns:
+        df (DataFrame): Cleaned activities data'''
+    
+    if version is None:
+        version = get_database_version()
+    
+    df = read_snapshot(version)
+    if df is not None:
+        return df
+    
+    df = get_data_from_database()
+    write_snapshot(df, version)
+    
+    return df
+
+def read_table_pages(select: str = '*', convert=None, page_size: int = 1000, max_workers: int = 8) -> list:
+    '''This function reads the supabase table in ranged pages that are requested concurrently, since PostgREST caps the rows of
+    a single request
+    
+    Args:
+        select (str): Columns to read, separated by commas
+        convert (function): Applied to each page DataFrame as it arrives
+        page_size (int): Rows per request. Lowered automatically to the server's row cap
+        max_workers (int): Number of pages to request at the same time
+        
+    Returns:
+        pages (list): DataFrame of each page in order'''
+    
+    supabase = get_supabase_client()
+    
+    def get_page(start: int, count: str | None = None):
+        # order by id so the pages do not overlap
+        return supabase.table("tom_runs_the_world").select(select, count=count).order('id_activity').range(start, start + page_size - 1).execute()
+    
+    def to_frame(data: list) -> pd.DataFrame:
+        df = pd.DataFrame(data)
+        return convert(df) if convert is not None and not df.empty else df
+    
+    # the first page also returns the total number of rows
+    first_page = get_page(0, count='exact')
+    total = first_page.count if first_page.count is not None else len(first_page.data)
+    
+    # the server returned fewer rows than asked for, so that is its row cap
+    if 0 < len(first_page.data) < min(page_size, total):
+        page_size = len(first_page.data)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = [to_frame(first_page.data)]
+        pages.extend(executor.map(lambda start: to_frame(get_page(start).data), range(page_size, total, page_size)))
+        
+    return pages
+
+def get_data_from_database(columns: list | None = APP_COLUMNS, page_size: int = 1000, max_workers: int = 8, backend: str = 'rest') -> pd.DataFrame:
+    '''This function calls the supabase table that holds the Strava API data
+    
+    Args:
+        columns (list): Columns to read. Pass None to read every column
+        page_size (int): Rows per request
+        max_workers (int): Number of pages to request at the same time
+        backend (str): 'rest' to read through the Supabase API, or 'postgres' to stream from the database directly
+    
+    Returns:
+        df (DataFrame): Dataframe loaded from table'''
+        
+    select = ','.join(columns) if columns else '*'
+
+    try:
+        # convert timedeltas, datetimes, and date parts as each page arrives
+        if backend == 'postgres':
+            pages = read_postgres_batches(columns, convert=decode_activities)
+        else:
+            pages = read_table_pages(select, convert=decode_activities, page_size=page_size, max_workers=max_workers)
+        df = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame()
+    except Exception as exc:
+        print(f"Could not load data from Supabase: {exc}")
+        return pd.DataFrame()
+    
+    if df.empty:
+        print("Supabase returned no rows; skipping recursive refresh.")
+        return pd.DataFrame()
+    
+    return df
+
+@functools.lru_cache(maxsize=1)
+def get_table_columns() -> frozenset:
+    '''This function reads the column names of the supabase table once per process
+    
+    Returns:
+        columns (frozenset): Column names, or an empty set if the table has no rows to read them from'''
+    
+    response = get_supabase_client().table("tom_runs_the_world").select("*").limit(1).execute()
+    return frozenset(response.data[0].keys()) if response.data else frozenset()
+
+##### DATABASE CODEC #####
+# how each typed column is stored in the supabase table. Other columns are stored as they are
+DATABASE_SCHEMA = {
+    'moving_time': 'interval',
+    'elapsed_time': 'interval',
+    'start_date': 'timestamp',
+    'start_date_local': 'timestamp',
+    'start_time_local_24h': 'time',
+    'monthly_date': 'timestamp',
+    'month_year': 'timestamp',
+}
+
+def encode_interval(col: pd.Series) -> np.ndarray:
+    '''This function formats timedeltas as HH:MM:SS, with hours past 24 instead of days
+    
+    Args:
+        col (Series): timedelta64 column
+        
+    Returns:
+        array: Formatted strings, None where the duration is missing'''
+    
+    seconds = col.dt.total_seconds().to_numpy()
+    valid = ~np.isnan(seconds)
+    
+    hours, remainder = np.divmod(seconds[valid].astype(np.int64), 3600)
+    minutes, secs = np.divmod(remainder, 60)
+    
+    encoded = np.full(len(col), None, dtype=object)
+    encoded[valid] = np.char.add(np.char.add(np.char.add(np.char.add(
+        np.char.zfill(hours.astype(str), 2), ':'), np.char.zfill(minutes.astype(str), 2)), ':'), np.char.zfill(secs.astype(str), 2))
+    
+    return encoded
+
+def encode_timestamp(col: pd.Series) -> np.ndarray:
+    '''This function formats datetimes as ISO 8601 strings to the second
+    
+    Args:
+        col (Series): datetime64 column
+        
+    Returns:
+        array: Formatted strings, None where the timestamp is missing'''
+    
+    col = parse_timestamp(col)
+    encoded = col.to_numpy(dtype='datetime64[s]').astype(str).astype(object)
+    encoded[col.isna().to_numpy()] = None
+    
+    return encoded
+
+def encode_time(col: pd.Series) -> np.ndarray:
+    '''This function formats times of day as HH:MM:SS
+    
+    Args:
+        col (Series): datetime.time objects
+        
+    Returns:
+        array: Formatted strings, None where the time is missing'''
+    
+    encoded = col.to_numpy(dtype=object).astype(str).astype(object)
+    encoded[col.isna().to_numpy()] = None
+    
+    return encoded
+
+def encode_activities(df: pd.DataFrame) -> pd.DataFrame:
+    '''This function converts activities to the values the supabase table accepts, one column at a time. The input DataFrame
+    is not changed
+    
+    Args:
+        df (DataFrame): Activities data
+        
+    Returns:
+        encoded (DataFrame): Activities data with JSON friendly values and None for missing values'''
+    
+    encoders = {'interval': encode_interval, 'timestamp': encode_timestamp, 'time': encode_time}
+    
+    columns = {}
+    for col in df.columns:
+        
+        # the string copies of ids are stored as the id itself, other string copies are dropped
+        if col.endswith('_str') and col != 'athlete.id_str':
+            continue
+        name = 'athlete.id' if col == 'athlete.id_str' else col
+        
+        kind = DATABASE_SCHEMA.get(col)
+        if kind is not None:
+            columns[name] = encoders[kind](df[col])
+        else:
+            # missing values become None
+            values = df[col].to_numpy(dtype=object)
+            values[df[col].isna().to_numpy()] = None
+            columns[name] = values
+    
+    return pd.DataFrame(columns, index=df.index, dtype=object)
+
+def decode_activities(df: pd.DataFrame) -> pd.DataFrame:
+    '''This function converts rows read from the supabase table back to the types the app uses. Date parts are derived again
+    from start_date_local rather than decoded
+    
+    Args:
+        df (DataFrame): Activities data as stored
+        
+    Returns:
+        df (DataFrame): Activities data with typed durations, timestamps, and date parts'''
+    
+    for col in ['moving_time', 'elapsed_time']:
+        df[col] = parse_duration(df[col])
+    
+    for col in ['start_date', 'start_date_local']:
+        df[col] = parse_timestamp(df[col])
+    
+    return add_date_columns(df)
+
+def numeric_columns(df: pd.DataFrame) -> list:
+    '''This function lists the numeric columns of typed activities data, which are hashed as numbers rather than as text
+    
+    Args:
+        df (DataFrame): Activities data
+        
+    Returns:
+        columns (list): Names of the numeric columns that are not booleans'''
+    
+    return [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+
+def hash_rows(df: pd.DataFrame, numeric: list = ()) -> pd.Series:
+    '''This function hashes the content of each row so changed rows can be found without comparing every value
+    
+    Args:
+        df (DataFrame): Encoded activities data
+        numeric (list): Columns to compare as float64 numbers, from numeric_columns of the typed data
+        
+    Returns:
+        hashes (Series): Row content hash indexed by id_activity'''
+    
+    # refresh_date changes on every refresh, so it is not part of the content
+    content = df.drop(columns=['refresh_date', 'row_hash'], errors='ignore')
+    
+    # the API returns whole number floats as JSON integers, so 175.0 would come back as 175
+    numeric = [col for col in numeric if col in content.columns]
+    content = content.assign(**{col: pd.to_numeric(content[col], errors='coerce').astype('float64') for col in numeric})
+    content = content[sorted(content.columns)].astype(str)
+    
+    return pd.Series(pd.util.hash_pandas_object(content, index=False).to_numpy(), index=df['id_activity'].to_numpy())
+
+def send_data_to_database(df: pd.DataFrame, chunk_size: int = 500, backend: str = 'rest', stored: pd.DataFrame | None = None) -> None:
+    '''This function syncs the database table with the new Strava API data. Only new or changed rows are upserted, in chunks,
+    and only rows that are no longer in the data are deleted. The refresh date of a stored row is when it last changed
+    
+    Args:
+        df (DataFrame): DataFrame to send to the table
+        chunk_size (int): Rows per upsert or delete request
+        backend (str): 'rest' to sync through the Supabase API, or 'postgres' to rebuild the whole table with COPY
+        stored (DataFrame): Rows already read from the table, as get_data_from_database returns them. Read again when the table
+            does not keep row hashes and this is not passed'''
+    
+    if df.empty:
+        print("No data to send to Supabase.")
+        return
+    
+    if backend == 'postgres':
+        try:
+            copy_data_to_postgres(df)
+        except Exception as exc:
+            print(f"Could not load data into Postgres: {exc}")
+        return
+       
+    # connect to supabase
+    supabase = get_supabase_client()
+    
+    try:
+        df_clean = encode_activities(df)
+
+        # Only include columns that exist in the Supabase table schema.
+        # This avoids insert failures for nested columns such as athlete.id_str.
+        try:
+            available_columns = get_table_columns() or set(df_clean.columns)
+        except Exception:
+            available_columns = set(df_clean.columns)
+
+        compatible_columns = [col for col in df_clean.columns if col in available_columns]
+        df_for_insert = df_clean[compatible_columns].drop_duplicates(subset='id_activity', keep='last')
+        numeric = numeric_columns(df)
+        new_hashes = hash_rows(df_for_insert, numeric)
+        
+        # hashes of the stored rows, read straight from the table when it keeps them
+        if 'row_hash' in available_columns:
+            df_for_insert = df_for_insert.assign(row_hash=new_hashes.astype(str).to_numpy())
+            stored = pd.concat(read_table_pages('id_activity,row_hash'), ignore_index=True)
+            stored_hashes = pd.Series(stored['row_hash'].to_numpy(), index=stored['id_activity'].to_numpy()) if not stored.empty else pd.Series(dtype=object)
+            new_hashes = new_hashes.astype(str)
+        else:
+            if stored is None:
+                stored = pd.concat(read_table_pages(','.join(compatible_columns), convert=decode_activities), ignore_index=True)
+            if not stored.empty:
+                stored_clean = encode_activities(stored)
+                stored_hashes = hash_rows(stored_clean[[col for col in compatible_columns if col in stored_clean.columns]], numeric)
+            else:
+                stored_hashes = pd.Series(dtype='uint64')
+            
+        changed = ~new_hashes.index.isin(stored_hashes.index) | (new_hashes != stored_hashes.reindex(new_hashes.index)).to_numpy()
+        vanished = stored_hashes.index[~stored_hashes.index.isin(new_hashes.index)].tolist()
+        
+        print(f"Sending {changed.sum()} new or changed rows and deleting {len(vanished)} rows")
+
+        # Convert the changed rows to a list of dictionaries
+        records = df_for_insert[changed].to_dict(orient='records')
+        
+        # upsert new and changed rows
+        for i in range(0, len(records), chunk_size):
+            supabase.table("tom_runs_the_world").upsert(records[i:i + chunk_size], on_conflict='id_activity').execute()
+        
+        # delete rows that are gone
+        for i in range(0, len(vanished), chunk_size):
+            supabase.table("tom_runs_the_world").delete().in_('id_activity', vanished[i:i + chunk_size]).execute()
+    except Exception as exc:
+        print(f"Could not send data to Supabase: {exc}")
+
+def get_postgres_connection(dsn: str | None = None) -> psycopg2.extensions.connection:
+    '''This function connects straight to the Supabase Postgres database, for bulk loads and reads that are too big for the
+    REST API. Numeric columns are returned as floats instead of Decimals
+    
+    Args:
+        dsn (str): Postgres connection string. Defaults to the supabase_db_url secret
+    
+    Returns:
+        conn (connection): psycopg2 connection'''
+    
+    conn = psycopg2.connect(dsn or get_secret('supabase_db_url'))
+    
+    decimal_to_float = psycopg2.extensions.new_type(psycopg2.extensions.DECIMAL.values, 'DECIMAL_TO_FLOAT', lambda value, cursor: float(value) if value is not None else None)
+    psycopg2.extensions.register_type(decimal_to_float, conn)
+    
+    return conn
+
+def copy_data_to_postgres(df: pd.DataFrame, table: str = 'tom_runs_the_world', dsn: str | None = None) -> None:
+    '''This function rebuilds the database table in bulk. The data is streamed into a temporary staging table with COPY, then
+    swapped into the table in one transaction, so readers see either the old rows or the new rows and a failed load changes
+    nothing. Row hashes are written too when the table keeps them, so the next sync through the API only sends changed rows
+    
+    Args:
+        df (DataFrame): DataFrame to send to the table
+        table (str): Name of the table to rebuild
+        dsn (str): Postgres connection string. Defaults to the supabase_db_url secret'''
+    
+    encoded = encode_activities(df)
+    df_clean = encoded.copy()
+    
+    # nested values are stored as JSON
+    for col in df_clean.columns[df_clean.dtypes == object]:
+        if df_clean[col].map(lambda value: isinstance(value, (list, dict))).any():
+            df_clean[col] = df_clean[col].map(lambda value: json.dumps(value) if isinstance(value, (list, dict)) else value)
+    
+    conn = get_postgres_connection(dsn)
+    
+    try:
+        with conn, conn.cursor() as cur:
+            
+            # only include columns that exist in the table
+            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table,))
+            available_columns = {row[0] for row in cur.fetchall()}
+            columns = [col for col in df_clean.columns if col in available_columns and col != 'row_hash']
+            
+            # hashed the same way send_data_to_database hashes rows, before nested values become JSON
+            if 'row_hash' in available_columns:
+                df_clean['row_hash'] = hash_rows(encoded[columns], numeric_columns(df)).astype(str).to_numpy()
+                columns.append('row_hash')
+        
+            buffer = io.StringIO()
+            df_clean[columns].to_csv(buffer, index=False, header=False, na_rep='\\N')
+            buffer.seek(0)
+        
+            column_list = sql.SQL(', ').join(map(sql.Identifier, columns))
+        
+            cur.execute(sql.SQL("CREATE TEMP TABLE staging (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP").format(sql.Identifier(table)))
+            cur.copy_expert(sql.SQL("COPY staging ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')").format(column_list).as_string(conn), buffer)
+        
+            # swap the new rows in
+            cur.execute(sql.SQL("DELETE FROM {}").format(sql.Identifier(table)))
+            cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM staging").format(sql.Identifier(table), column_list, column_list))
+        
+            print(f"Loaded {len(df_clean)} rows into {table}")
+    
+    finally:
+        conn.close()
+
+def read_postgres_batches(columns: list | None = None, convert=None, batch_size: int = 5000, table: str = 'tom_runs_the_world', dsn: str | None = None) -> list:
+    '''This function reads the database table through a server-side cursor, so rows are streamed in batches instead of
+    being held by the server and the client all at once
+    
+    Args:
+        columns (list): Columns to read. Pass None to read every column
+        convert (function): Applied to each batch DataFrame as it arrives
+        batch_size (int): Rows per batch
+        table (str): Name of the table to read
+        dsn (str): Postgres connection string. Defaults to the supabase_db_url secret
+        
+    Returns:
+        batches (list): DataFrame of each batch in order'''
+    
+    column_list = sql.SQL(', ').join(map(sql.Identifier, columns)) if columns else sql.SQL('*')
+    query = sql.SQL("SELECT {} FROM {} ORDER BY id_activity").format(column_list, sql.Identifier(table))
+    
+    batches = []
+    conn = get_postgres_connection(dsn)
+    
+    try:
+        with conn, conn.cursor(name='read_activities') as cur:
+            cur.itersize = batch_size
+            cur.execute(query)
+            
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                batch = pd.DataFrame.from_records(rows, columns=[col.name for col in cur.description])
+                batches.append(convert(batch) if convert is not None else batch)
+    finally:
+        conn.close()
+    
+    return batches
+
+##### BACKGROUND REFRESH #####
+def refresh_dataset(reporter=None, full: bool = False, average_weather: bool = False, backend: str = 'rest') -> pd.DataFrame:
+    '''This function runs a full refresh: new activities are downloaded onto the stored data, saved to the database, and the
+    local snapshot is rebuilt. It holds the sync lock the whole time
+
+    Args:
+        reporter (object): Where progress is reported. Defaults to st.status in the page
+        full (bool): Download every activity again instead of only the new ones
+        average_weather (bool): Average temperature and humidity over the whole activity instead of the hour it started
+        backend (str): 'rest' to read and sync through the Supabase API, or 'postgres' to read from the database directly and
+            rebuild the whole table with COPY
+
+    Returns:
+        df (DataFrame): Refreshed activities data'''
+
+    with sync_lock():
+
+        # only new activities are downloaded and merged into every stored column
+        existing_df = None if full else get_data_from_database(columns=None, backend=backend)
+        df = get_strava_data(existing_df, average_weather=average_weather, reporter=reporter)
+
+        # never replace the stored data with nothing
+        if df.empty:
+            raise RuntimeError('No data was returned by Strava or the database')
+
+        send_data_to_database(df, backend=backend, stored=existing_df)
+        write_snapshot(df, get_database_version())
+
+    return df
+
+class RefreshJob:
+    '''This class runs the data refresh in a background thread so pages keep serving the current data while it runs. Only one
+    refresh runs at a time, no matter how many sessions ask for one. Progress is kept in a RefreshStatus that any page can poll,
+    and the finished dataset is published to the shared DatasetStore'''
+
+    def __init__(self):
+        self.status = RefreshStatus()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, refresh=refresh_dataset) -> bool:
+        '''This function starts a refresh unless one is already running
+
+        Args:
+            refresh (function): Refresh to run. It is passed the job status to report progress to
+
+        Returns:
+            bool: True if a new refresh was started'''
+
+        with self._lock:
+            if self.running:
+                return False
+
+            self.status.reset()
+            self.status.start('Refresh queued...')
+            self._thread = threading.Thread(target=self._run, args=(refresh,), name='strava-refresh', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, refresh) -> None:
+
+        try:
+            df = refresh(self.status)
+            # every session switches to the new data on its next run
+            get_dataset_store().publish(df)
+        except Exception as exc:
+            print(f"Refresh failed: {exc}")
+            self.status.update(f'Refresh failed: {exc}', state='error')
+            return
+
+        self.status.update('Data is Served!')
+
+@st.cache_resource
+def get_refresh_job() -> RefreshJob:
+    '''This function creates one refresh job that is shared by every session of the app
+
+    Returns:
+        job (RefreshJob): Background refresh job'''
+
+    return RefreshJob()
+
+def show_refresh_status() -> None:
+    '''This function shows the progress of a running background refresh. While one is running it checks again every two
+    seconds, and reruns the page once the new data is ready. Call it after load_data'''
+
+    job = get_refresh_job()
+    store = get_dataset_store()
+
+    def render_status():
+
+        status = job.status.snapshot()
+
+        if job.running:
+            st.info(status['label'] + (' ' + status['messages'][-1] if status['messages'] else ''))
+            if status['progress'] is not None:
+                st.progress(status['progress'])
+        elif status['state'] == 'error':
+            st.error(status['label'])
+        elif st.session_state.get('dataset_version') not in (None, store.version):
+            # rerun the whole page so it picks up the new data
+            st.rerun()
+
+    st.fragment(render_status, run_every=2 if job.running else None)()
+
+##### SHARED DATASET #####
+class Dataset:
+    '''This class holds the cleaned activities data that every session reads, and the version id it was built from. It is
+    shared, so it must never be changed in place: pages copy or filter it before changing columns. Results derived from it
+    are cached by version, so a refresh invalidates them once for everyone. The filter indexes and the metrics cube are built
+    with it, and the filter options and dates the page header shows are worked out the first time a page asks for them
+
+    Args:
+        df (DataFrame): Cleaned activities data
+        version (str): Dataset version id'''
+
+    __slots__ = ('_df', '_version', '_index', '_cube', '_metadata')
+
+    def __init__(self, df: pd.DataFrame, version: str):
+        self._df = df
+        self._version = version
+        self._index = ActivityIndex(df)
+        self._cube = MetricsCube(df, self._index)
+        self._metadata = None
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._df
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+    @property
+    def index(self) -> 'ActivityIndex':
+        return self._index
+
+    @property
+    def cube(self) -> 'MetricsCube':
+        return self._cube
+
+    @property
+    def metadata(self) -> 'DatasetMetadata':
+        # two sessions building it at once get equal results, so no lock is needed
+        if self._metadata is None:
+            self._metadata = DatasetMetadata.from_frame(self._df)
+        return self._metadata
+
+# date parts derived by add_date_columns
+DATE_PART_COLUMNS = [
+    'start_time_local_24h', 'start_time_local_24h_hour', 'start_time_local_12h', 'weekday_num', 'weekday', 'month_num', 'month',
+    'monthly_date', 'month_year', 'month_year_name', 'year'
+]
+# columns the pages read. Everything else from the Strava response is dropped from memory
+DATASET_COLUMNS = APP_COLUMNS + DATE_PART_COLUMNS
+# low cardinality strings, metrics that do not need double precision, and small integers
+CATEGORY_COLUMNS = ['type', 'brand_name', 'name_gear', 'gear_id', 'weekday', 'month', 'month_year_name', 'start_time_local_12h']
+FLOAT32_COLUMNS = [
+    'distance_activity', 'total_elevation_gain', 'elev_high', 'elev_low', 'average_speed', 'max_speed', 'average_heartrate',
+    'max_heartrate', 'suffer_score', 'temp', 'rhum'
+]
+SMALL_INT_COLUMNS = {'start_time_local_24h_hour': 'int8', 'weekday_num': 'int8', 'month_num': 'int8', 'year': 'int16'}
+
+def compact_activities(df: pd.DataFrame) -> pd.DataFrame:
+    '''This function keeps only the columns the pages read and stores them in compact types: categories for low cardinality
+    strings, float32 for metrics, and small integers for date parts. Group bys over the category columns need observed=True,
+    and frames built for display pass through display_floats
+    
+    Args:
+        df (DataFrame): Cleaned activities data
+        
+    Returns:
+        df (DataFrame): Compact copy of the activities data'''
+    
+    df = df[[col for col in DATASET_COLUMNS if col in df.columns]]
+    
+    dtypes = {col: 'category' for col in CATEGORY_COLUMNS if col in df.columns}
+    dtypes.update({col: 'float32' for col in FLOAT32_COLUMNS if col in df.columns})
+    # integer types cannot hold missing values
+    dtypes.update({col: dtype for col, dtype in SMALL_INT_COLUMNS.items() if col in df.columns and df[col].notna().all()})
+    
+    return df.astype(dtypes)
+
+def display_floats(df: pd.DataFrame, decimals: int = 2) -> pd.DataFrame:
+    '''This function converts the float32 columns of a frame that is about to be shown to rounded float64, so a distance of 3.1
+    shows as 3.1 rather than 3.0999999046325684
+    
+    Args:
+        df (DataFrame): Data to show
+        decimals (int): Decimal places to keep
+        
+    Returns:
+        df (DataFrame): Copy of the data with float64 columns in place of float32 ones'''
+    
+    columns = df.columns[df.dtypes == 'float32']
+    
+    return df.assign(**{col: df[col].astype('float64').round(decimals) for col in columns})
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    '''This function compares the memory used by each column of two versions of a DataFrame
+    
+    Args:
+        before (DataFrame): Original data
+        after (DataFrame): Compacted data
+        
+    Returns:
+        report (DataFrame): Bytes per column before and after, with a total row. Dropped columns have no after value'''
+    
+    report = pd.DataFrame({
+        'before': before.memory_usage(deep=True, index=False),
+        'after': after.memory_usage(deep=True, index=False),
+    })
+    report.loc['total'] = report.sum()
+    
+    return report.sort_values('before', ascending=False)
+
+# how refresh dates are stored in the dataset
+REFRESH_DATE_FORMAT = '%Y-%m-%d %I:%M %p'
+
+def latest_refresh_date(col: pd.Series) -> str:
+    '''This function finds the latest refresh date. Rows keep the date they last changed, and dates like 11:00 AM sort after
+    01:00 PM as text, so the dates are compared as times
+    
+    Args:
+        col (Series): Refresh dates formatted as REFRESH_DATE_FORMAT
+        
+    Returns:
+        refresh_date (str): Latest refresh date in the same format, or an empty string when there is none'''
+    
+    dates = pd.to_datetime(pd.Series(col.dropna().unique()), format=REFRESH_DATE_FORMAT)
+    
+    return dates.max().strftime(REFRESH_DATE_FORMAT) if not dates.empty else ''
+
+def prepare_dataset(df: pd.DataFrame, version: str | None = None, compact: bool = True) -> Dataset:
+    '''This function corrects the data types of the stored activities data and wraps it in a Dataset
+
+    Args:
+        df (DataFrame): Activities data from the snapshot, the database, or a refresh
+        version (str): Database version stamp the data was built from. Derived from the data when it is unknown
+        compact (bool): Keep only the columns the pages read, in compact types
+
+    Returns:
+        dataset (Dataset): Cleaned activities data and its version id'''
+
+    # columns that are already typed are not parsed again
+    df = transform_activities(df.copy())
+
+    # only a handful of distinct refresh dates, so format each one once
+    refresh_dates = df['refresh_date'].unique()
+    df['refresh_date'] = df['refresh_date'].map(dict(zip(refresh_dates, pd.to_datetime(refresh_dates).strftime(REFRESH_DATE_FORMAT))))
+
+    if version is None:
+        version = f"local|{latest_refresh_date(df['refresh_date'])}|{len(df)}"
+
+    if compact:
+        compacted = compact_activities(df)
+        report = memory_report(df, compacted)
+        # memory_report has the bytes of each column when more detail is needed
+        print(f"Dataset memory: {report.loc['total', 'before'] / 1e6:.1f} MB before, {report.loc['total', 'after'] / 1e6:.1f} MB after compacting")
+        df = compacted
+
+    return Dataset(df, version)
+
+# seconds between checks of the database version, so data synced by another process is picked up
+VERSION_CHECK_SECONDS = 60
+
+class DatasetStore:
+    '''This class holds the current Dataset for the whole process. The first session to ask for it loads it, and a finished
+    refresh swaps in a new one. The database version is checked at most once a minute, so data written by a scheduled sync is
+    loaded too. Sessions that are mid run keep the Dataset they started with'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dataset = None
+        self._checked_at = 0.0
+
+    @property
+    def version(self) -> str | None:
+        dataset = self._dataset
+        return dataset.version if dataset is not None else None
+
+    def get(self) -> Dataset:
+        '''This function returns the current Dataset, loading it first if no session has yet
+
+        Returns:
+            dataset (Dataset): Current activities data'''
+
+        dataset = self._dataset
+        if dataset is not None and time.monotonic() - self._checked_at < VERSION_CHECK_SECONDS:
+            return dataset
+
+        if dataset is None:
+            # other sessions wait for the first load instead of loading again
+            self._lock.acquire()
+        elif not self._lock.acquire(blocking=False):
+            # another session is already checking, so keep serving the current data
+            return dataset
+
+        try:
+            if self._dataset is not None and time.monotonic() - self._checked_at < VERSION_CHECK_SECONDS:
+                return self._dataset
+
+            version = get_database_version()
+            self._checked_at = time.monotonic()
+
+            if self._dataset is None:
+                self._dataset = prepare_dataset(load_dataset(version), version)
+            elif version is not None and version != self._dataset.version:
+                print(f"Database version changed from {self._dataset.version} to {version}, reloading")
+                try:
+                    self._dataset = prepare_dataset(load_dataset(version), version)
+                except Exception as exc:
+                    print(f"Could not reload dataset, keeping version {self._dataset.version}: {exc}")
+
+            return self._dataset
+        finally:
+            self._lock.release()
 
-        # convert start_date and start_date_local to datetime
-        pre_df['start_date'] = pd.to_datetime(pd.to_datetime(pre_df['start_date']).dt.strftime('%Y-%m-%d %H:%M:%S'))
-        pre_df['start_date_local'] = pd.to_datetime(pd.to_datetime(pre_df['start_date_local']).dt.strftime('%Y-%m-%d %H:%M:%S'))
+    def publish(self, df: pd.DataFrame) -> Dataset:
+        '''This function swaps in refreshed data for every session
 
-        # add start time for analysis and in am/pm format
-        pre_df['start_time_local_24h'] = pd.to_datetime(pre_df['start_date_local'])
-        pre_df['start_time_local_24h_hour'] = pd.to_datetime(pre_df['start_date_local']).dt.round('H').dt.hour
-        pre_df['start_time_local_12h'] = pd.to_datetime(pre_df['start_date_local']).dt.strftime("%I:%M %p")
+        Args:
+            df (DataFrame): Refreshed activities data
 
-        # add day of week
-        pre_df['weekday'] = pd.to_datetime(pre_df['start_date_local']).dt.day_name()
-        pre_df['weekday_num'] = pd.to_datetime(pre_df['start_date_local']).dt.weekday
+        Returns:
+            dataset (Dataset): The new current Dataset'''
 
-        # add month
-        pre_df['month'] = pd.to_datetime(pre_df['start_date_local']).dt.month_name()
-        pre_df['month_num'] = pd.to_datetime(pre_df['start_date_local']).dt.month
-        pre_df['monthly_date'] = pd.to_datetime(pd.to_datetime(pre_df['start_date_local']).dt.strftime('%Y-%m')).apply(lambda x: x.replace(year=2025))
+        dataset = prepare_dataset(df, get_database_version())
+        with self._lock:
+            self._dataset = dataset
+            self._checked_at = time.monotonic()
+        return dataset
 
-        # add month year
-        pre_df['month_year'] = pd.to_datetime(pd.to_datetime(pre_df['start_date_local']).dt.strftime('%Y-%m'))
-        
-        # add month year name
-        pre_df['month_year_name'] = pd.to_datetime(pre_df['start_date_local']).dt.strftime('%b %Y')
+@st.cache_resource
+def get_dataset_store() -> DatasetStore:
+    '''This function creates one dataset store that is shared by every session of the app
 
-        # add year label
-        pre_df['year'] = pd.to_datetime(pre_df['start_date_local']).dt.year
-        
-        #add timestamp
-        pre_df['refresh_date'] = pd.Timestamp.now(tz='America/New_York').strftime('%Y-%m-%d %I:%M %p')
-        
-        pre_df.drop(columns=['start_latlng', 'end_latlng', 'start_latitude', 'start_longitude'], inplace=True)
+    Returns:
+        store (DatasetStore): Process wide dataset store'''
+
+    return DatasetStore()
+
+def get_dataset() -> Dataset:
+    '''This function returns the current shared Dataset and remembers which version this session is showing
 
-        str_columns = [col for col in pre_df.columns if col.endswith('_str')]
-        if str_columns:
-            pre_df = pre_df.drop(columns=str_columns)
-    
-        status.update(label='Data is Served!', state='complete', expanded=False)
-        
-        return pre_df
-    
-def get_data_from_database() -> pd.DataFrame:
-    '''This function calls the supabase table that holds the Strava API data
-    
     Returns:
-        df (DataFrame): Dataframe loaded from table'''
-        
-    url = st.secrets['supabase_url']
-    key = st.secrets['supabase_secret']
+        dataset (Dataset): Current activities data'''
 
-    supabase = sb.create_client(url, key)
+    dataset = get_dataset_store().get()
+    st.session_state.dataset_version = dataset.version
+    return dataset
 
-    try:
-        # get all data from the table
-        response = supabase.table("tom_runs_the_world").select("*").execute()
-        df = pd.DataFrame(response.data)
-    except Exception as exc:
-        print(f"Could not load data from Supabase: {exc}")
-        return pd.DataFrame()
-    
-    if df.empty:
-        print("Supabase returned no rows; skipping recursive refresh.")
-        return pd.DataFrame()
+def load_data() -> pd.DataFrame:
     
-    # convert timedeltas
-    df['moving_time'] = pd.to_timedelta(df['moving_time'])
-    df['elapsed_time'] = pd.to_timedelta(df['elapsed_time'])
-    # convert time object
-    df['start_time_local_24h'] = pd.to_datetime(df['start_time_local_24h']).dt.time
-    # convert datetime
-    df['start_date'] = pd.to_datetime(pd.to_datetime(df['start_date']).dt.strftime('%Y-%m-%d %H:%M:%S'))
-    df['start_date_local'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m-%d %H:%M:%S'))
-    df['monthly_date'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m'))
-    df['month_year'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m'))
+    '''This function loads the shared, cleaned dataframe. It is read only: copy it before changing columns.
     
-    return df
-
-def send_data_to_database(df: pd.DataFrame) -> None:
-    '''This function replaces the data in the database table with the new Strava API data
+    Returns: DataFrame: Strava dataframe'''
     
-    Args:
-        df (DataFrame): DataFrame to send to the table'''
-       
-    # connect to supabase
-    url = st.secrets['supabase_url']
-    key = st.secrets['supabase_secret']
+    return get_dataset().df
 
-    supabase = sb.create_client(url, key)
-    
-    try:
-        # Delete all data
-        supabase.table("tom_runs_the_world").delete().neq("id_activity", 0).execute()
+##### DATASET METADATA #####
+@dataclass(frozen=True)
+class DatasetMetadata:
+    '''This class holds the filter options and dates every page shows above its charts. It is built once per Dataset
 
-        # convert timedeltas
-        df['moving_time'] = df['moving_time'].astype(str)
-        df['elapsed_time'] = df['elapsed_time'].astype(str)
-        # convert time object
-        df['start_time_local_24h'] = df['start_time_local_24h'].apply(lambda x: x.strftime('%H:%M:%S'))
-        # convert datetime
-        df['start_date'] = df['start_date'].apply(lambda x: x.isoformat())
-        df['start_date_local'] = df['start_date_local'].apply(lambda x: x.isoformat())
-        df['monthly_date'] = df['monthly_date'].apply(lambda x: x.isoformat())
-        df['month_year'] = df['month_year'].apply(lambda x: x.isoformat())
+    Args:
+        act_types (list): Activity types, most common first
+        years (list): Years with activities, newest first
+        gear_brands (list): Gear brands, most used first
+        refresh_date (str): When the data was last refreshed
+        max_date (Timestamp): Start of the latest activity
+        rolling_12_months (Timestamp): Start of the rolling 12 months window'''
 
-        # Replace np.nan with None for any other remaining NaN values
-        df_clean = df.replace({np.nan: None})
+    act_types: list
+    years: list
+    gear_brands: list
+    refresh_date: str
+    max_date: pd.Timestamp
+    rolling_12_months: pd.Timestamp
 
-        if 'athlete.id_str' in df_clean.columns:
-            df_clean = df_clean.rename(columns={'athlete.id_str': 'athlete.id'})
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'DatasetMetadata':
+        '''This function works out the metadata from the typed columns of the activities data
 
-        df_clean = df_clean.drop(columns=[col for col in df_clean.columns if col.endswith('_str')], errors='ignore')
+        Args:
+            df (DataFrame): Cleaned activities data
 
-        # Only include columns that exist in the Supabase table schema.
-        # This avoids insert failures for nested columns such as athlete.id_str.
-        try:
-            schema_response = supabase.table("tom_runs_the_world").select("*").limit(0).execute()
-            available_columns = set(schema_response.data[0].keys()) if schema_response.data else set()
-        except Exception:
-            available_columns = set(df_clean.columns)
+        Returns:
+            metadata (DatasetMetadata): Filter options and dates'''
 
-        compatible_columns = [col for col in df_clean.columns if col in available_columns]
-        df_for_insert = df_clean[compatible_columns]
+        # value counts of a category column also list unused categories
+        type_counts = df['type'].value_counts()
+        brand_counts = df['brand_name'].value_counts()
+        max_date = df['start_date_local'].max()
 
-        # Convert the cleaned DataFrame to a list of dictionaries
-        records = df_for_insert.to_dict(orient='records')
-        
-        # insert new data
-        supabase.table("tom_runs_the_world").insert(records).execute()
-    except Exception as exc:
-        print(f"Could not send data to Supabase: {exc}")
+        return cls(
+            act_types=type_counts[type_counts > 0].index.tolist(),
+            years=sorted(df['year'].dropna().unique().tolist(), reverse=True),
+            gear_brands=brand_counts[brand_counts > 0].index.tolist(),
+            refresh_date=latest_refresh_date(df['refresh_date']),
+            max_date=max_date,
+            rolling_12_months=max_date - pd.DateOffset(months=12),
+        )
 
-@st.cache_data()
-def load_data() -> pd.DataFrame:
-    
-    '''This function loads the dataframe from the session state. It then corrects the data types.
-    
-    Returns: DataFrame: Strava dataframe'''
-    
-    df = pd.DataFrame(st.session_state.strava_data)
-    
-    # convert moving_time and elapsed time to H% M% S% format
-    df['moving_time'] = pd.to_timedelta(df['moving_time'])
-    df['elapsed_time'] = pd.to_timedelta(df['elapsed_time'])
-    
-    # convert start_date and start_date_local to datetime
-    df['start_date'] = pd.to_datetime(pd.to_datetime(df['start_date']).dt.strftime('%Y-%m-%d %H:%M:%S'))
-    df['start_date_local'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m-%d %H:%M:%S'))
-    
-    # add start time for analysis and in am/pm format
-    df['start_time_local_24h'] = pd.to_datetime(df['start_date_local']).dt.time
-    df['start_time_local_12h'] = pd.to_datetime(df['start_date_local']).dt.strftime("%I:%M %p")
-    df['monthly_date'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m'))
-    df['month_year'] = pd.to_datetime(pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m'))
-    
-    df['refresh_date'] = pd.to_datetime(df['refresh_date']).dt.strftime('%Y-%m-%d %I:%M %p')
-    
-    return df
+    @property
+    def year_filter(self) -> list:
+        return ['All', 'Rolling 12 Months'] + self.years
 
 def default_activity_selection(highlighted_activities: list) -> list:
     
@@ -428,36 +1978,677 @@ def default_gear_brand_selection(gear_brand_list: list) -> list:
     
     return gear_filter
 
+def filter_activities(df: pd.DataFrame, year_selection, act_types, gear_brands, rolling_start: pd.Timestamp | None = None) -> pd.DataFrame:
+    '''This function filters the dataframe by activity type, year and gear brand
+    
+    Args:
+        df (DataFrame): DataFrame to filter
+        year_selection (str): Selected year, 'All', or 'Rolling 12 Months'
+        act_types (list): Selected activity types
+        gear_brands (list): Selected gear brands
+        rolling_start (Timestamp): Start of the rolling 12 months
+        
+    Returns:
+        df (DataFrame): Filtered dataframe'''
+    
+    mask = df['type'].isin(act_types) & df['brand_name'].isin(gear_brands)
+    
+    if year_selection == 'Rolling 12 Months':
+        mask &= df['start_date_local'] >= rolling_start
+    elif year_selection != 'All':
+        mask &= df['year'] == year_selection
+    
+    return df[mask]
+
+class ActivityIndex:
+    '''This class holds the indexes used to filter a Dataset. Activity type, gear brand and year each get a packed bitmap per
+    distinct value, and start_date_local is kept sorted so time windows are found with a binary search. Any filter
+    combination is then a few bitmap ORs and ANDs
+    
+    Args:
+        df (DataFrame): Cleaned activities data'''
+    
+    bitmap_columns = ['type', 'brand_name', 'year']
+    
+    def __init__(self, df: pd.DataFrame):
+        
+        self.n_rows = len(df)
+        
+        # one packed bitmap per distinct value. Missing values get no bitmap, so they never match a selection
+        self.bitmaps = {}
+        for col in self.bitmap_columns:
+            codes, values = pd.factorize(df[col])
+            self.bitmaps[col] = {value: np.packbits(codes == code) for code, value in enumerate(values)}
+        
+        # row positions ordered by start time. Missing start times are left out, so they never fall in a window
+        start = df['start_date_local'].to_numpy()
+        valid = np.flatnonzero(~pd.isna(start))
+        order = np.argsort(start[valid], kind='stable')
+        self.start_order = valid[order]
+        self.start_sorted = start[valid][order]
+        
+    def any_of(self, col: str, values) -> np.ndarray:
+        '''This function ORs the bitmaps of the selected values of a column
+        
+        Args:
+            col (str): Indexed column
+            values (list): Selected values
+            
+        Returns:
+            bitmap (array): Packed bitmap of the rows holding any of the values'''
+        
+        bitmap = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in self.bitmaps[col]:
+                bitmap |= self.bitmaps[col][value]
+        return bitmap
+    
+    def since(self, start: pd.Timestamp) -> np.ndarray:
+        '''This function finds the rows that started at or after a time
+        
+        Args:
+            start (Timestamp): Start of the window
+            
+        Returns:
+            bitmap (array): Packed bitmap of the rows in the window'''
+        
+        first = np.searchsorted(self.start_sorted, np.datetime64(start, 'ns'), side='left')
+        rows = np.zeros(self.n_rows, dtype=bool)
+        rows[self.start_order[first:]] = True
+        return np.packbits(rows)
+    
+    def between(self, start: pd.Timestamp, end: pd.Timestamp) -> np.ndarray:
+        '''This function finds the rows that started in a time window
+        
+        Args:
+            start (Timestamp): Start of the window, included
+            end (Timestamp): End of the window, excluded
+            
+        Returns:
+            positions (array): Row positions in the window'''
+        
+        first, last = np.searchsorted(self.start_sorted, [np.datetime64(start, 'ns'), np.datetime64(end, 'ns')], side='left')
+        return np.sort(self.start_order[first:last])
+    
+    def select(self, year_selection, act_types, gear_brands, rolling_start: pd.Timestamp | None = None) -> np.ndarray:
+        '''This function resolves the filters to row positions
+        
+        Args:
+            year_selection (str): Selected year, 'All', or 'Rolling 12 Months'
+            act_types (list): Selected activity types
+            gear_brands (list): Selected gear brands
+            rolling_start (Timestamp): Start of the rolling 12 months
+            
+        Returns:
+            positions (array): Matching row positions in their original order'''
+        
+        bitmap = self.any_of('type', act_types) & self.any_of('brand_name', gear_brands)
+        
+        if year_selection == 'Rolling 12 Months':
+            bitmap &= self.since(rolling_start)
+        elif year_selection != 'All':
+            bitmap &= self.any_of('year', [year_selection])
+        
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_rows))
+
+def filter_key(version: str, year_selection, act_types, gear_brands, rolling_start: pd.Timestamp | None = None) -> tuple:
+    '''This function builds a cache key for a dataset version and filter state. The order of the selections does not change
+    the key, and the rolling start only counts when the rolling 12 months are selected
+    
+    Returns:
+        key (tuple): Hashable filter state'''
+    
+    return (version, year_selection, frozenset(act_types), frozenset(gear_brands),
+            rolling_start if year_selection == 'Rolling 12 Months' else None)
+
+class FilterEngine:
+    '''This class memoizes filtered views of the shared Dataset. Each combination of dataset version, year, activity types and
+    gear brands is filtered once, kept in a small LRU cache, and the same result is handed to every chart that asks for it.
+    Results are shared, so they must not be changed in place
+    
+    Args:
+        maxsize (int): Number of filtered views to keep'''
+    
+    def __init__(self, maxsize: int = 32):
+        self._cache = cachetools.LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        
+    def filter(self, dataset: Dataset, year_selection, act_types, gear_brands, rolling_start: pd.Timestamp | None = None) -> pd.DataFrame:
+        '''This function returns the filtered view of a Dataset, filtering it only if this combination has not been seen
+        
+        Args:
+            dataset (Dataset): Shared activities data
+            year_selection (str): Selected year, 'All', or 'Rolling 12 Months'
+            act_types (list): Selected activity types
+            gear_brands (list): Selected gear brands
+            rolling_start (Timestamp): Start of the rolling 12 months
+            
+        Returns:
+            df (DataFrame): Filtered dataframe'''
+        
+        key = filter_key(dataset.version, year_selection, act_types, gear_brands, rolling_start)
+        
+        with self._lock:
+            result = self._cache.get(key)
+        
+        if result is None:
+            positions = dataset.index.select(year_selection, act_types, gear_brands, rolling_start)
+            result = dataset.df.take(positions)
+            with self._lock:
+                self._cache[key] = result
+                
+        return result
+
+@st.cache_resource
+def get_filter_engine() -> FilterEngine:
+    '''This function creates one filter engine that is shared by every session of the app
+    
+    Returns:
+        engine (FilterEngine): Memoized dataset filters'''
+    
+    return FilterEngine()
+
+def page_dataset(local_vars: dict) -> Dataset:
+    '''This function returns the Dataset a page loaded at the start of its run. The store may have loaded a newer one since,
+    and results built from the page's data must be keyed by the version they came from
+    
+    Args:
+        local_vars (dict): Page variables holding dataset. Without it the current Dataset is used
+        
+    Returns:
+        dataset (Dataset): Activities data the page is showing'''
+    
+    dataset = local_vars.get('dataset')
+    
+    return dataset if dataset is not None else get_dataset_store().get()
+
 def df_query_builder(df: pd.DataFrame, year_selection: str, local_vars: dict) -> pd.DataFrame:
-    '''This function builds a query to filter the dataframe based on the selected activity type, year and gear brand.
+    '''This function filters the dataframe based on the selected activity type, year and gear brand. Filters of the shared
+    dataset are memoized, so every chart in a run gets the same result without filtering again. The result is read only.
     
     Args:
         df (DataFrame): DataFrame to filter
         year_selection (str): Selected year from filter
-        local_vars (dict): Local variables to use in the query
+        local_vars (dict): Local variables holding act_type_selection, gear_brand_selection, rolling_12_months and dataset
         
     Returns:
         df (DataFrame): Filtered dataframe based on the selected filters'''
+    
+    act_types = local_vars['act_type_selection']
+    gear_brands = local_vars['gear_brand_selection']
+    rolling_start = local_vars.get('rolling_12_months')
+    
+    dataset = page_dataset(local_vars)
+    if df is dataset.df:
+        return get_filter_engine().filter(dataset, year_selection, act_types, gear_brands, rolling_start)
+    
+    return filter_activities(df, year_selection, act_types, gear_brands, rolling_start)
+
+##### LAZY TABS #####
+def lazy_tabs(labels: list, key: str) -> str:
+    '''This function draws a row of tabs and returns the active one. Unlike st.tabs, where every tab is built and sent on each
+    rerun, the page only builds the tab that is returned
+    
+    Args:
+        labels (list): Tab labels
+        key (str): Widget key, unique to the page
+        
+    Returns:
+        label (str): Active tab'''
+    
+    last = st.session_state.get(key + '_last', labels[0])
+    active = st.segmented_control('Tab', labels, default=last, key=key, label_visibility='collapsed')
+    
+    # clicking the active tab again clears the selection, so keep showing it
+    if active is None:
+        active = last
+    st.session_state[key + '_last'] = active
+    
+    return active
+
+@st.cache_resource
+def get_section_cache() -> tuple:
+    '''This function creates one cache of built tabs that is shared by every session of the app
+    
+    Returns:
+        cache (LRUCache): Built tabs by name, dataset version and filter state
+        lock (Lock): Guards the cache'''
+    
+    return cachetools.LRUCache(maxsize=64), threading.Lock()
+
+def cached_section(name: str, build, year_selection: str, local_vars: dict):
+    '''This function returns the data and figures of a tab, building them only the first time a dataset version and filter
+    state asks for them. The result is shared, so it must not be changed
+    
+    Args:
+        name (str): Tab name, unique across pages
+        build (function): Builds the tab when it is not cached. Takes no arguments
+        year_selection (str): Selected year from filter
+        local_vars (dict): Local variables holding act_type_selection, gear_brand_selection, rolling_12_months and dataset
+        
+    Returns:
+        result: What build returned'''
+    
+    # the version the page's data came from, which build uses
+    version = page_dataset(local_vars).version
+    key = (name,) + filter_key(version, year_selection, local_vars['act_type_selection'], local_vars['gear_brand_selection'],
+                               local_vars.get('rolling_12_months'))
+    
+    cache, lock = get_section_cache()
+    with lock:
+        result = cache.get(key)
+    
+    if result is None:
+        result = build()
+        with lock:
+            cache[key] = result
+    
+    return result
+
+##### METRICS CUBE #####
+# finest grain the dashboard charts group by. Year and monthly_date are derived from month_year
+CUBE_DIMENSIONS = ['month_year', 'type', 'brand_name', 'name_gear', 'weekday_num', 'weekday', 'start_time_local_24h_hour']
+# summed and counted so totals and means can be rolled up from the cells
+CUBE_METRICS = ['distance_activity', 'total_elevation_gain', 'moving_time', 'average_speed', 'max_speed', 'average_heartrate',
+                'max_heartrate', 'suffer_score']
+
+def build_cube_cells(df: pd.DataFrame) -> pd.DataFrame:
+    '''This function aggregates activities to one row per combination of the cube dimensions, holding the number of
+    activities and the sum and non-missing count of every metric
+    
+    Args:
+        df (DataFrame): Cleaned activities data
         
-    conditions = []
+    Returns:
+        cells (DataFrame): Cube cells'''
+    
+    metrics = [col for col in CUBE_METRICS if col in df.columns]
+    
+    aggregations = {'activities': ('type', 'size'), 'upload_id_count': ('upload_id', 'count')}
+    for col in metrics:
+        aggregations[col + '_sum'] = (col, 'sum')
+        aggregations[col + '_count'] = (col, 'count')
+    
+    # keep missing dimension values, so rolling up over other dimensions does not lose activities
+    cells = df.groupby(CUBE_DIMENSIONS, dropna=False, observed=True, sort=False).agg(**aggregations).reset_index()
+    # sum float32 metrics in double precision
+    cells = cells.astype({col + '_sum': 'float64' for col in metrics if cells[col + '_sum'].dtype == 'float32'})
+    
+    month = cells['month_year'].dt.month.to_numpy()
+    cells['year'] = cells['month_year'].dt.year
+    cells['monthly_date'] = (np.datetime64('2025-01', 'M') + (month - 1)).astype('datetime64[ns]')
+    
+    return cells
+
+def rollup_cells(cells: pd.DataFrame, by: list, metrics: dict) -> pd.DataFrame:
+    '''This function rolls cube cells up to the chart dimensions
+    
+    Args:
+        cells (DataFrame): Cube cells
+        by (list): Dimensions to group by
+        metrics (dict): Output column names mapped to (column, aggregation), where aggregation is 'size', 'count', 'sum' or
+            'mean', as in DataFrame.agg
+            
+    Returns:
+        df (DataFrame): One row per group with the dimensions and metrics as columns'''
+    
+    columns = {}
+    for name, (col, how) in metrics.items():
+        if how == 'size':
+            columns[name] = ['activities']
+        elif how == 'count':
+            columns[name] = [col + '_count']
+        elif how == 'sum':
+            columns[name] = [col + '_sum']
+        elif how == 'mean':
+            columns[name] = [col + '_sum', col + '_count']
+        else:
+            raise ValueError(f"Cannot roll up '{how}' from the metrics cube")
+    
+    needed = list(dict.fromkeys(col for cols in columns.values() for col in cols))
+    totals = cells.groupby(by, observed=True)[needed].sum()
+    
+    df = pd.DataFrame(index=totals.index)
+    for name, (col, how) in metrics.items():
+        if how == 'mean':
+            count = totals[col + '_count']
+            df[name] = totals[col + '_sum'] / count.where(count > 0)
+        else:
+            df[name] = totals[columns[name][0]]
+    
+    return df.reset_index()
+
+class MetricsCube:
+    '''This class holds the activities of a Dataset pre-aggregated by the chart dimensions. Charts roll it up instead of
+    grouping the activities, so they cost as much as the number of cells. A rolling window that starts part way through a
+    month takes that month from the activities themselves
     
-    # activity type filter
-    conditions.append("type in @act_type_selection")
+    Args:
+        df (DataFrame): Cleaned activities data
+        index (ActivityIndex): Filter indexes of the same data'''
+    
+    def __init__(self, df: pd.DataFrame, index: ActivityIndex):
+        self.df = df
+        self.index = index
+        self.cells = build_cube_cells(df)
+        
+    def select(self, year_selection, act_types, gear_brands, rolling_start: pd.Timestamp | None = None) -> pd.DataFrame:
+        '''This function filters the cube cells
+        
+        Args:
+            year_selection (str): Selected year, 'All', or 'Rolling 12 Months'
+            act_types (list): Selected activity types
+            gear_brands (list): Selected gear brands
+            rolling_start (Timestamp): Start of the rolling 12 months
+            
+        Returns:
+            cells (DataFrame): Cube cells matching the filters'''
+        
+        cells = self.cells
+        mask = cells['type'].isin(act_types) & cells['brand_name'].isin(gear_brands)
+        
+        if year_selection == 'Rolling 12 Months':
+            # whole months after the start come from the cube, and the month the window starts in from the activities
+            next_month = rolling_start.to_period('M').to_timestamp() + pd.DateOffset(months=1)
+            rows = self.df.take(self.index.between(rolling_start, next_month))
+            rows = rows[rows['type'].isin(act_types) & rows['brand_name'].isin(gear_brands)]
+            return pd.concat([cells[mask & (cells['month_year'] >= next_month)], build_cube_cells(rows)], ignore_index=True)
+        
+        if year_selection != 'All':
+            mask &= cells['year'] == year_selection
+        
+        return cells[mask]
 
-    # year filter
-    if year_selection == 'All':
-        conditions.append("year != 'None'")
-    elif year_selection == 'Rolling 12 Months':
-        conditions.append("start_date_local >= @rolling_12_months")
+def rollup_metrics(df: pd.DataFrame, year_selection: str, local_vars: dict, by: list, **metrics) -> pd.DataFrame:
+    '''This function aggregates the filtered activities for a chart from the metrics cube. It gives the same result as
+    df_query_builder(...).groupby(by).agg(**metrics).reset_index()
+    
+    Args:
+        df (DataFrame): Activities data
+        year_selection (str): Selected year from filter
+        local_vars (dict): Local variables holding act_type_selection, gear_brand_selection, rolling_12_months and dataset
+        by (list): Dimensions to group by, from CUBE_DIMENSIONS, year, or monthly_date
+        **metrics: Output column names mapped to (column, aggregation)
+        
+    Returns:
+        df (DataFrame): One row per group with the dimensions and metrics as columns'''
+    
+    act_types = local_vars['act_type_selection']
+    gear_brands = local_vars['gear_brand_selection']
+    rolling_start = local_vars.get('rolling_12_months')
+    
+    dataset = page_dataset(local_vars)
+    if df is dataset.df:
+        cells = dataset.cube.select(year_selection, act_types, gear_brands, rolling_start)
     else:
-        conditions.append("year == @year_selection")
+        cells = build_cube_cells(filter_activities(df, year_selection, act_types, gear_brands, rolling_start))
+    
+    return rollup_cells(cells, by, metrics)
+
+##### CHART SPECS #####
+def to_hours(col: pd.Series) -> pd.Series:
+    return (col.dt.total_seconds() / 3600).round(2)
+
+def round_2(col: pd.Series) -> pd.Series:
+    return col.round(2)
+
+def to_int(col: pd.Series) -> pd.Series:
+    return col.round(2).astype(int)
+
+@dataclass(frozen=True, eq=False)
+class ChartSpec:
+    '''This class declares a chart that is drawn from aggregated activities. Specs that group by the same keys are aggregated
+    together by plan_charts
+    
+    Args:
+        title (str): Subheader shown above the chart
+        by (list): Columns to group by, from the metrics cube dimensions
+        metric (str): Column to aggregate
+        agg (str): 'size', 'count', 'sum' or 'mean'
+        name (str): Name of the aggregated column in the chart
+        chart (str): 'line' or 'bar'
+        labels (dict): Display names of the group by columns
+        color (str): Display name of the column to color by
+        y_label (str): Label of the y axis
+        convert (function): Unit conversion applied to the aggregated column, such as to_hours
+        prepare (function): Applied to the chart data after renaming, for derived labels
+        caption (str): Caption shown under the subheader
+        x_column (str): Display name of the x axis column. Defaults to the first group by column'''
+    
+    title: str
+    by: list
+    metric: str
+    agg: str
+    name: str
+    chart: str = 'line'
+    labels: dict = field(default_factory=dict)
+    color: str | None = None
+    y_label: str | None = None
+    convert: object = None
+    prepare: object = None
+    caption: str | None = None
+    x_column: str | None = None
+    
+    @property
+    def column(self) -> str:
+        return f'{self.metric}_{self.agg}'
+    
+    @property
+    def x(self) -> str:
+        return self.x_column or self.labels.get(self.by[0], self.by[0])
+    
+    def frame(self, totals: pd.DataFrame) -> pd.DataFrame:
+        '''This function takes the chart data out of the aggregated frame shared with the other specs of the same keys
+        
+        Args:
+            totals (DataFrame): Aggregated group by columns and metrics
+            
+        Returns:
+            df (DataFrame): Chart data with display names'''
+        
+        df = totals[list(self.by) + [self.column]].rename(columns={self.column: self.name})
+        if self.convert is not None:
+            df[self.name] = self.convert(df[self.name])
+        df = df.rename(columns=self.labels)
+        if self.prepare is not None:
+            df = self.prepare(df)
+        return df
+
+def plan_charts(specs: list, df: pd.DataFrame, year_selection: str, local_vars: dict) -> dict:
+    '''This function aggregates the data of every chart spec. Specs are merged by their group by keys, so each set of keys is
+    aggregated once with all of its metrics, and every chart gets its slice. The data is keyed by chart title, which stays the
+    same across reruns, so cached chart data still matches the specs a page builds on its next run
+    
+    Args:
+        specs (list): ChartSpec of every chart on the page
+        df (DataFrame): Activities data
+        year_selection (str): Selected year from filter
+        local_vars (dict): Local variables holding act_type_selection, gear_brand_selection, rolling_12_months and dataset
+        
+    Returns:
+        charts (dict): Chart data keyed by spec title'''
+    
+    titles = [spec.title for spec in specs]
+    if len(set(titles)) != len(titles):
+        raise ValueError(f"Chart titles must be unique to plan them together: {titles}")
+    
+    groups = {}
+    for spec in specs:
+        groups.setdefault(tuple(spec.by), []).append(spec)
+    
+    charts = {}
+    for by, group in groups.items():
+        metrics = {spec.column: (spec.metric, spec.agg) for spec in group}
+        totals = rollup_metrics(df, year_selection, local_vars, list(by), **metrics)
+        for spec in group:
+            charts[spec.title] = spec.frame(totals)
+    
+    return charts
+
+def render_chart(spec: ChartSpec, charts: dict) -> None:
+    '''This function draws a chart spec with its planned data
+    
+    Args:
+        spec (ChartSpec): Chart to draw
+        charts (dict): Chart data from plan_charts'''
+    
+    st.subheader(spec.title)
+    if spec.caption:
+        st.caption(spec.caption)
+    
+    draw = st.bar_chart if spec.chart == 'bar' else st.line_chart
+    draw(charts[spec.title], x=spec.x, y=spec.name, y_label=spec.y_label, color=spec.color)
+
+##### BOX PLOTS #####
+def reservoir_sample(n: int, k: int, seed: int = 0) -> np.ndarray:
+    '''This function picks a uniform random sample of rows. Every row draws a random priority and the k lowest are kept, which
+    is a reservoir sample taken in one vectorized pass. The seed is fixed so cached figures do not change between reruns
+    
+    Args:
+        n (int): Number of rows
+        k (int): Largest sample to keep
+        seed (int): Random seed
+        
+    Returns:
+        positions (array): Sorted row positions of the sample'''
+    
+    if n <= k:
+        return np.arange(n)
+    
+    priority = np.random.default_rng(seed).random(n)
+    return np.sort(np.argpartition(priority, k)[:k])
+
+def box_stats(df: pd.DataFrame, x: str, y: str) -> tuple:
+    '''This function computes box plot statistics for every group with grouped quantiles: quartiles, and whiskers at the most
+    extreme values within 1.5 times the interquartile range
+    
+    Args:
+        df (DataFrame): Data to summarize
+        x (str): Column to group by
+        y (str): Column to summarize
+        
+    Returns:
+        stats (DataFrame): q1, median, q3, lowerfence and upperfence by group, as plotly names them
+        outliers (DataFrame): Rows outside the whiskers'''
+    
+    data = display_floats(df[[x, y]].dropna())
+
+    if data.empty:
+        return pd.DataFrame(columns=['q1', 'median', 'q3', 'lowerfence', 'upperfence']), data
+
+    groups = data.groupby(x, observed=True)[y]
+    
+    stats = groups.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ['q1', 'median', 'q3']
+    
+    iqr = stats['q3'] - stats['q1']
+    key = data[x].to_numpy()
+    lower = (stats['q1'] - 1.5 * iqr).reindex(key).to_numpy()
+    upper = (stats['q3'] + 1.5 * iqr).reindex(key).to_numpy()
+    
+    values = data[y].to_numpy()
+    inside = (values >= lower) & (values <= upper)
+    
+    stats['lowerfence'] = data.loc[inside, y].groupby(data.loc[inside, x], observed=True).min()
+    stats['upperfence'] = data.loc[inside, y].groupby(data.loc[inside, x], observed=True).max()
+    
+    return stats, data[~inside]
+
+def box_plot(df: pd.DataFrame, x: str, y: str, labels: dict | None = None, points: int = 300, seed: int = 0) -> go.Figure:
+    '''This function draws a box plot from statistics computed here instead of sending every activity to the browser. Outliers
+    and an optional jittered layer of points are capped by sampling, so the figure stays the same size however many
+    activities there are
+    
+    Args:
+        df (DataFrame): Data to plot
+        x (str): Column with a box for each value
+        y (str): Column to summarize
+        labels (dict): Axis titles by column
+        points (int): Largest number of points to draw next to the boxes, and of outliers. 0 for no points
+        seed (int): Random seed of the point sample
+        
+    Returns:
+        fig (Figure): Plotly figure'''
+    
+    labels = labels or {}
+    stats, outliers = box_stats(df, x, y)
+    
+    fig = go.Figure()
+    fig.add_trace(go.Box(
+        x=stats.index.to_numpy(), q1=stats['q1'], median=stats['median'], q3=stats['q3'],
+        lowerfence=stats['lowerfence'], upperfence=stats['upperfence'], boxpoints=False, name=labels.get(y, y),
+    ))
+    
+    if points:
+        
+        outliers = outliers.iloc[reservoir_sample(len(outliers), points, seed)]
+        fig.add_trace(go.Scatter(x=outliers[x].to_numpy(), y=outliers[y], mode='markers', name='Outliers'))
         
-    # gear brand filter
-    conditions.append("brand_name in @gear_brand_selection")
+        # a see-through box carries the jittered points
+        data = df[[x, y]].dropna()
+        sample = display_floats(data.iloc[reservoir_sample(len(data), points, seed)])
+        fig.add_trace(go.Box(
+            x=sample[x].to_numpy(), y=sample[y], boxpoints='all', jitter=0.5, pointpos=0, name='Sample',
+            fillcolor='rgba(0,0,0,0)', line={'width': 0}, marker={'size': 3, 'opacity': 0.4}, hoveron='points',
+        ))
+    
+    fig.update_layout(xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y), boxmode='overlay', showlegend=False)
+    
+    return fig
 
-    query = ' and '.join(conditions)
+##### DENSITY SCATTER #####
+# scatter charts with more points than this are drawn binned
+SCATTER_POINT_LIMIT = 5000
+SCATTER_BINS = 40
+
+def bin_scatter(df: pd.DataFrame, x: str, y: str, color: str, limit: int = SCATTER_POINT_LIMIT, bins: int = SCATTER_BINS) -> tuple:
+    '''This function prepares the data of a scatter chart. Up to the point limit every row is drawn. Above it, x and y are
+    binned into a 2D histogram and each occupied bin is drawn once, sized by its number of rows and colored by the value of
+    color that is most common in it
+    
+    Args:
+        df (DataFrame): Data to plot
+        x (str): Column on the x axis
+        y (str): Column on the y axis
+        color (str): Column to color by
+        limit (int): Largest number of points drawn without binning
+        bins (int): Number of bins along each axis
+        
+    Returns:
+        data (DataFrame): Chart data
+        size (str): Column to size the points by, or None when the rows are not binned'''
+    
+    data = df[[x, y, color]].dropna()
+    
+    if len(data) <= limit:
+        return data, None
+    
+    x_values = data[x].to_numpy(dtype='float64')
+    y_values = data[y].to_numpy(dtype='float64')
+    codes, colors = pd.factorize(data[color])
+    
+    x_edges = np.histogram_bin_edges(x_values, bins)
+    y_edges = np.histogram_bin_edges(y_values, bins)
+    # the last edge belongs to the last bin
+    x_bin = np.clip(np.searchsorted(x_edges, x_values, side='right') - 1, 0, bins - 1)
+    y_bin = np.clip(np.searchsorted(y_edges, y_values, side='right') - 1, 0, bins - 1)
+    
+    # one histogram per color, counted in a single pass
+    counts = np.bincount((x_bin * bins + y_bin) * len(colors) + codes, minlength=bins * bins * len(colors)).reshape(bins * bins, len(colors))
+    total = counts.sum(axis=1)
+    occupied = np.flatnonzero(total)
+    
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    
+    binned = pd.DataFrame({
+        x: x_centers[occupied // bins].round(2),
+        y: y_centers[occupied % bins].round(2),
+        color: np.asarray(colors)[counts[occupied].argmax(axis=1)],
+        'Activities': total[occupied],
+    })
     
-    return df.query(query, local_dict=local_vars)
+    return binned, 'Activities'
 
 def convert_timedelta(td: pd.Timedelta) -> str:
     '''This function converts a timedelta object to a string in hours and minutes
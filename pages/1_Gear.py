@@ -1,206 +1,142 @@
-import pandas as pd
 import streamlit as st
-import plotly.express as px
 
+import bootstrap
 import functions as fn
 
-df = fn.load_data()
+df, year_selection, act_type_selection, gear_brand_selection, rolling_12_months, dataset = bootstrap.render_page()
 
-sidebar_logo = './images/tom_runs_the_world_sidebar.png'
-title_logo = './images/tom_runs_the_world_title.png'
-st.logo(sidebar_logo)
-
-refresh_date = df['refresh_date'].max()
-max_date = pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m-%d %I:%M %p').max()
-
-# distict activity type list
-highlighted_activities = ['Run', 'Hike', 'Walk', 'Ride']
-act_type_filter = df['type'].value_counts().index.tolist()
-act_type_filter = list(dict.fromkeys(act_type_filter))
-
-# distinct year list
-year_filter = sorted(df['year'].unique().tolist(), reverse=True)
-year_filter.insert(0, 'All')
-year_filter.insert(1, 'Rolling 12 Months')
-
-# distinct gear type list
-gear_brand_list = df['brand_name'].value_counts().index.tolist()
-
-# rolling 12 mo variable
-today = pd.to_datetime(max_date)
-rolling_12_months = today - pd.DateOffset(months=12)
-
-# header
-with st.container():
-    st.image(title_logo)
-    st.subheader('Strava Data Analysis')
-    st.page_link('Overview.py', label='Refresh Data', help='Refresh data on Overview tab')
-    st.caption('Last Refreshed: ' + str(refresh_date))
-    st.caption('Last Activity Date: ' + max_date)
-    st.divider()
-
-# filters in sidebar
-with st.sidebar:
-    
-    st.header('Filters')
-    
-    # initialize year selection
-    st.session_state.year_selection = st.session_state.get('year_selection', fn.default_year_selection())
-    year_selection = st.selectbox('Years', year_filter, key='year_selection')
-    
-    # initialize activity type selection
-    st.session_state.act_type_selection = st.session_state.get('act_type_selection', fn.default_activity_selection(highlighted_activities))
-    act_type_selection = st.multiselect('Activity Type', act_type_filter, placeholder='Select Activity Type', key='act_type_selection')
-    
-    # initialize gear brand selection
-    st.session_state.gear_brand_selection = st.session_state.get('gear_brand_selection', fn.default_gear_brand_selection(gear_brand_list))
-    gear_brand_selection = st.multiselect('Gear Brand', gear_brand_list, placeholder='Select Gear Brand', key='gear_brand_selection')
-    
 st.header('Gear')
 
-# tabs
-tab_act, tab_dist, tab_ele, tab_time, tab_speed, tab_heart, tab_effort = st.tabs(['Activities', 'Distance', 'Elevation', 'Time', 'Speed', 'Heart Rate', 'Relative Effort'])
-
-with tab_act:
+# charts drawn from aggregates. Charts with the same group by columns are aggregated together
+brand_gear = {'brand_name': 'Gear Brand', 'name_gear': 'Gear'}
+month_gear = {'month_year': 'Month', 'name_gear': 'Gear'}
+
+act_charts = [
+    fn.ChartSpec('Total Activities By Gear Brand', ['brand_name', 'name_gear'], 'upload_id', 'count', 'Activities', chart='bar', labels=brand_gear, color='Gear', y_label='# of Activities'),
+    fn.ChartSpec('Total Activities By Gear', ['brand_name', 'name_gear'], 'upload_id', 'count', 'Activities', chart='bar', labels=brand_gear, color='Gear', y_label='# of Activities', x_column='Gear'),
+    fn.ChartSpec('Total Activities By Gear By Month', ['month_year', 'name_gear'], 'upload_id', 'size', 'Activities', labels=month_gear, color='Gear', y_label='# of Activities'),
+]
+dist_charts = [
+    fn.ChartSpec('Total Distance By Gear Brand', ['brand_name', 'name_gear'], 'distance_activity', 'sum', 'Distance', chart='bar', labels=brand_gear, color='Gear', y_label='Distance (mi)'),
+    fn.ChartSpec('Total Distance By Gear', ['brand_name', 'name_gear'], 'distance_activity', 'sum', 'Distance', chart='bar', labels=brand_gear, color='Gear', y_label='Distance (mi)', x_column='Gear'),
+    fn.ChartSpec('Total Distance By Gear By Month', ['month_year', 'name_gear'], 'distance_activity', 'sum', 'Distance', labels=month_gear, color='Gear', y_label='Distance (mi)'),
+]
+ele_charts = [
+    fn.ChartSpec('Total Elevation By Gear Brand', ['brand_name', 'name_gear'], 'total_elevation_gain', 'sum', 'Elevation', chart='bar', labels=brand_gear, color='Gear', y_label='Elevation (ft)'),
+    fn.ChartSpec('Total Elevation By Gear', ['brand_name', 'name_gear'], 'total_elevation_gain', 'sum', 'Elevation', chart='bar', labels=brand_gear, color='Gear', y_label='Elevation (ft)', x_column='Gear'),
+    fn.ChartSpec('Total Elevation By Gear By Month', ['month_year', 'name_gear'], 'total_elevation_gain', 'sum', 'Elevation', labels=month_gear, color='Gear', y_label='Elevation (ft)'),
+]
+time_charts = [
+    fn.ChartSpec('Total Time By Gear Brand', ['brand_name', 'name_gear'], 'moving_time', 'sum', 'Time', chart='bar', labels=brand_gear, color='Gear', y_label='Time (hrs)', convert=fn.to_hours),
+    fn.ChartSpec('Total Time By Gear', ['brand_name', 'name_gear'], 'moving_time', 'sum', 'Time', chart='bar', labels=brand_gear, color='Gear', y_label='Time (hrs)', convert=fn.to_hours, x_column='Gear'),
+    fn.ChartSpec('Total Time By Gear By Month', ['month_year', 'name_gear'], 'moving_time', 'sum', 'Time', labels=month_gear, color='Gear', y_label='Time (hrs)', convert=fn.to_hours),
+]
+speed_chart = fn.ChartSpec('Avg Speed By Gear By Month', ['month_year', 'name_gear'], 'average_speed', 'mean', 'Avg Speed', labels=month_gear, color='Gear', y_label='Avg Speed (mph)', convert=fn.round_2)
+heart_chart = fn.ChartSpec('Avg Heart Rate By Gear By Month', ['month_year', 'name_gear'], 'average_heartrate', 'mean', 'Avg Heart Rate', labels=month_gear, color='Gear', y_label='Avg Heart Rate (mph)', convert=fn.round_2)
+effort_chart = fn.ChartSpec('Relative Effort By Gear By Month', ['month_year', 'name_gear'], 'suffer_score', 'mean', 'Avg Relative Effort', labels=month_gear, color='Gear', y_label='Avg Relative Effort', convert=fn.round_2)
+
+def box_by_gear(col: str, label: str, convert=None):
+    temp_df = fn.df_query_builder(df, year_selection, globals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
+    if convert is not None:
+        temp_df[col] = convert(temp_df[col])
+    return fn.box_plot(temp_df, 'Gear', col, labels={col: label})
+
+def build_tab(specs: list, boxes: list) -> tuple:
+    # aggregated charts and box plots of one tab
+    return fn.plan_charts(specs, df, year_selection, globals()), [box_by_gear(*box) for box in boxes]
+
+# only the active tab is built, and it is reused until the data or filters change
+tab = fn.lazy_tabs(['Activities', 'Distance', 'Elevation', 'Time', 'Speed', 'Heart Rate', 'Relative Effort'], key='gear_tab')
+
+if tab == 'Activities':
+    
+    charts, figs = fn.cached_section('gear_activities', lambda: build_tab(act_charts, []), year_selection, locals())
     
     with st.container():
         
-        st.subheader('Total Activities By Gear Brand')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Activities=('upload_id', 'count')).reset_index().rename(columns={'brand_name': 'Gear Brand', 'name_gear': 'Gear'})
-        st.bar_chart(temp_df, x='Gear Brand', y='Activities', y_label='# of Activities', color='Gear')
+        for spec in act_charts:
+            fn.render_chart(spec, charts)
         
-        st.subheader('Total Activities By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Activities=('upload_id', 'count')).reset_index().rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        st.bar_chart(temp_df, x='Gear', y='Activities', y_label='# of Activities', color='Gear')
-
-        st.subheader('Total Activities By Gear By Month')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).sort_values(by='start_date_local').groupby(['month_year', 'name_gear'], sort=False).size().reset_index(name='Activities').rename(columns={'month_year': 'Month', 'name_gear': 'Gear'})
-        st.line_chart(temp_df, x='Month', y='Activities', y_label='# of Activities', color='Gear')
-        
-with tab_dist:
+elif tab == 'Distance':
+    
+    charts, figs = fn.cached_section('gear_distance', lambda: build_tab(dist_charts, [('distance_activity', 'Distance (mi)')]), year_selection, locals())
     
     with st.container():
         
-        st.subheader('Total Distance By Gear Brand')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Distance=('distance_activity', 'sum')).reset_index().rename(columns={'brand_name': 'Gear Brand', 'name_gear': 'Gear'})
-        st.bar_chart(temp_df, x='Gear Brand', y='Distance', y_label='Distance (mi)', color='Gear')
-        
-        st.subheader('Total Distance By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Distance=('distance_activity', 'sum')).reset_index().rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        st.bar_chart(temp_df, x='Gear', y='Distance', y_label='Distance (mi)', color='Gear')
-
-        st.subheader('Total Distance By Gear By Month')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).sort_values(by='start_date_local').groupby(['month_year', 'name_gear'], sort=False).agg(Distance=('distance_activity', 'sum')).reset_index().rename(columns={'month_year': 'Month', 'name_gear': 'Gear'})
-        st.line_chart(temp_df, x='Month', y='Distance', y_label='Distance (mi)', color='Gear')
+        for spec in dist_charts:
+            fn.render_chart(spec, charts)
         
         st.subheader('Distance By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        fig = px.box(temp_df, x='Gear', y='distance_activity', labels={'distance_activity': 'Distance (mi)'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[0])
 
-with tab_ele:
+elif tab == 'Elevation':
+    
+    charts, figs = fn.cached_section('gear_elevation', lambda: build_tab(ele_charts, [('total_elevation_gain', 'Elevation (ft)')]), year_selection, locals())
     
     with st.container():
         
-        st.subheader('Total Elevation By Gear Brand')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Elevation=('total_elevation_gain', 'sum')).reset_index().rename(columns={'brand_name': 'Gear Brand', 'name_gear': 'Gear'})
-        st.bar_chart(temp_df, x='Gear Brand', y='Elevation', y_label='Elevation (ft)', color='Gear')
-        
-        st.subheader('Total Elevation By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Elevation=('total_elevation_gain', 'sum')).reset_index().rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        st.bar_chart(temp_df, x='Gear', y='Elevation', y_label='Elevation (ft)', color='Gear')
-
-        st.subheader('Total Elevation By Gear By Month')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).sort_values(by='start_date_local').groupby(['month_year', 'name_gear'], sort=False).agg(Elevation=('total_elevation_gain', 'sum')).reset_index().rename(columns={'month_year': 'Month', 'name_gear': 'Gear'})
-        st.line_chart(temp_df, x='Month', y='Elevation', y_label='Elevation (ft)', color='Gear')
+        for spec in ele_charts:
+            fn.render_chart(spec, charts)
         
         st.subheader('Elevation By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        fig = px.box(temp_df, x='Gear', y='total_elevation_gain', labels={'total_elevation_gain': 'Elevation (ft)'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[0])
         
-with tab_time:
+elif tab == 'Time':
+    
+    charts, figs = fn.cached_section('gear_time', lambda: build_tab(time_charts, [('moving_time', 'Time (hrs)', fn.to_hours)]), year_selection, locals())
     
     with st.container():
         
-        st.subheader('Total Time By Gear Brand')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Time=('moving_time', 'sum')).reset_index().rename(columns={'brand_name': 'Gear Brand', 'name_gear': 'Gear'})
-        temp_df['Time'] = (temp_df['Time'].dt.total_seconds() / 3600).round(2)
-        st.bar_chart(temp_df, x='Gear Brand', y='Time', y_label='Time (hrs)', color='Gear')
-        
-        st.subheader('Total Time By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['brand_name', 'name_gear']).agg(Time=('moving_time', 'sum')).reset_index().rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        temp_df['Time'] = (temp_df['Time'].dt.total_seconds() / 3600).round(2)
-        st.bar_chart(temp_df, x='Gear', y='Time', y_label='Time (hrs)', color='Gear')
-
-        st.subheader('Total Time By Gear By Month')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).sort_values(by='start_date_local').groupby(['month_year', 'name_gear'], sort=False).agg(Time=('moving_time', 'sum')).reset_index().rename(columns={'month_year': 'Month', 'name_gear': 'Gear'})
-        temp_df['Time'] = (temp_df['Time'].dt.total_seconds() / 3600).round(2)
-        st.line_chart(temp_df, x='Month', y='Time', y_label='Time (hrs)', color='Gear')
+        for spec in time_charts:
+            fn.render_chart(spec, charts)
         
         st.subheader('Time By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        temp_df['moving_time'] = (temp_df['moving_time'].dt.total_seconds() / 3600).round(2)
-        fig = px.box(temp_df, x='Gear', y='moving_time', labels={'moving_time': 'Time (hrs)'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[0])
         
-with tab_speed:
+elif tab == 'Speed':
+    
+    charts, figs = fn.cached_section('gear_speed', lambda: build_tab([speed_chart], [('average_speed', 'Avg Speed (mph)'), ('max_speed', 'Max Speed (mph)')]), year_selection, locals())
     
     with st.container():
         
         st.subheader('Avg Speed By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        fig = px.box(temp_df, x='Gear', y='average_speed', labels={'average_speed': 'Avg Speed (mph)'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[0])
 
-        st.subheader('Avg Speed By Gear By Month')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).sort_values(by='start_date_local').groupby(['month_year', 'name_gear'], sort=False).agg(avg_speed=('average_speed', 'mean')).reset_index().rename(columns={'month_year': 'Month', 'name_gear': 'Gear', 'avg_speed': 'Avg Speed'})
-        temp_df['Avg Speed'] = temp_df['Avg Speed'].round(2)
-        st.line_chart(temp_df, x='Month', y='Avg Speed', y_label='Avg Speed (mph)', color='Gear')
+        fn.render_chart(speed_chart, charts)
         
         st.subheader('Max Speed By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        fig = px.box(temp_df, x='Gear', y='max_speed', labels={'max_speed': 'Max Speed (mph)'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[1])
         
-with tab_heart:
+elif tab == 'Heart Rate':
+    
+    charts, figs = fn.cached_section('gear_heart_rate', lambda: build_tab([heart_chart], [('average_heartrate', 'Avg Heart Rate'), ('max_heartrate', 'Max Heart Rate')]), year_selection, locals())
     
     with st.container():
         
         st.subheader('Avg Heart Rate By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        fig = px.box(temp_df, x='Gear', y='average_heartrate', labels={'average_heartrate': 'Avg Heart Rate'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[0])
 
-        st.subheader('Avg Heart Rate By Gear By Month')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).sort_values(by='start_date_local').groupby(['month_year', 'name_gear'], sort=False).agg(avg_heartrate=('average_heartrate', 'mean')).reset_index().rename(columns={'month_year': 'Month', 'name_gear': 'Gear', 'avg_heartrate': 'Avg Heart Rate'})
-        temp_df['Avg Heart Rate'] = temp_df['Avg Heart Rate'].round(2)
-        st.line_chart(temp_df, x='Month', y='Avg Heart Rate', y_label='Avg Heart Rate (mph)', color='Gear')
+        fn.render_chart(heart_chart, charts)
         
         st.subheader('Max Heart Rate By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        fig = px.box(temp_df, x='Gear', y='max_heartrate', labels={'max_heartrate': 'Max Heart Rate'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[1])
         
-with tab_effort:
+elif tab == 'Relative Effort':
+    
+    charts, figs = fn.cached_section('gear_relative_effort', lambda: build_tab([effort_chart], [('suffer_score', 'Realtive Effort')]), year_selection, locals())
     
     with st.container():
         
         st.caption('Relative Effort: Metric that quantifies the cardiovascular work done during an activity')
         
         st.subheader('Realtive Effort By Gear')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).rename(columns={'name_gear': 'Gear', 'brand_name': 'Gear Brand'})
-        fig = px.box(temp_df, x='Gear', y='suffer_score', labels={'suffer_score': 'Realtive Effort'}, points='all')
-        st.plotly_chart(fig)
+        st.plotly_chart(figs[0])
 
-        st.subheader('Relative Effort By Gear By Month')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).sort_values(by='start_date_local').groupby(['month_year', 'name_gear'], sort=False).agg(avg_suffer_score=('suffer_score', 'mean')).reset_index().rename(columns={'month_year': 'Month', 'name_gear': 'Gear', 'avg_suffer_score': 'Avg Relative Effort'})
-        temp_df['Avg Relative Effort'] = temp_df['Avg Relative Effort'].round(2)
-        st.line_chart(temp_df, x='Month', y='Avg Relative Effort', y_label='Avg Relative Effort', color='Gear')
+        fn.render_chart(effort_chart, charts)
 
 st.divider()
 # created gear dataframe
-temp_df = df.groupby(['brand_name', 'name_gear', 'retired']).agg(
+temp_df = fn.display_floats(df.groupby(['brand_name', 'name_gear', 'retired'], observed=True).agg(
     Total_Activities=('upload_id', 'count'),
     Total_Distance=('distance_activity', 'sum'),
     Max_Distance=('distance_activity', 'max'),
@@ -216,7 +152,7 @@ temp_df = df.groupby(['brand_name', 'name_gear', 'retired']).agg(
     # Max_Relative_Effort=('suffer_score', 'max'),
     First_Activity_Date=('start_date_local', 'min'),
     Last_Activity_Date=('start_date_local', 'max')).reset_index().sort_values(by=['retired', 'Last_Activity_Date'],
-                                                                              ascending=[True, False]).round(2)
+                                                                              ascending=[True, False]).round(2))
 
 # format date and time
 temp_df['First_Activity_Date'] = temp_df['First_Activity_Date'].dt.strftime('%Y-%m-%d')
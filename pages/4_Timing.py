@@ -2,131 +2,48 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 
+import bootstrap
 import functions as fn
 
-df = fn.load_data()
+df, year_selection, act_type_selection, gear_brand_selection, rolling_12_months, dataset = bootstrap.render_page()
 
-sidebar_logo = './images/tom_runs_the_world_sidebar.png'
-title_logo = './images/tom_runs_the_world_title.png'
-st.logo(sidebar_logo)
-
-refresh_date = df['refresh_date'].max()
-max_date = pd.to_datetime(df['start_date_local']).dt.strftime('%Y-%m-%d %I:%M %p').max()
-
-# distict activity type list
-highlighted_activities = ['Run', 'Hike', 'Walk', 'Ride']
-act_type_filter = df['type'].value_counts().index.tolist()
-act_type_filter = list(dict.fromkeys(act_type_filter))
-
-# distinct year list
-year_filter = sorted(df['year'].unique().tolist(), reverse=True)
-year_filter.insert(0, 'All')
-year_filter.insert(1, 'Rolling 12 Months')
-
-# distinct gear type list
-gear_brand_list = df['brand_name'].value_counts().index.tolist()
-
-# rolling 12 mo variable
-today = pd.to_datetime(max_date)
-rolling_12_months = today - pd.DateOffset(months=12)
-
-# header
-with st.container():
-    st.image(title_logo)
-    st.subheader('Strava Data Analysis')
-    st.page_link('Overview.py', label='Refresh Data', help='Refresh data on Overview tab')
-    st.caption('Last Refreshed: ' + str(refresh_date))
-    st.caption('Last Activity Date: ' + max_date)
-    st.divider()
-
-# filters in sidebar
-with st.sidebar:
-    
-    st.header('Filters')
-    
-    # initialize year selection
-    st.session_state.year_selection = st.session_state.get('year_selection', fn.default_year_selection())
-    year_selection = st.selectbox('Years', year_filter, key='year_selection')
-    
-    # initialize activity type selection
-    st.session_state.act_type_selection = st.session_state.get('act_type_selection', fn.default_activity_selection(highlighted_activities))
-    act_type_selection = st.multiselect('Activity Type', act_type_filter, placeholder='Select Activity Type', key='act_type_selection')
-    
-    # initialize gear brand selection
-    st.session_state.gear_brand_selection = st.session_state.get('gear_brand_selection', fn.default_gear_brand_selection(gear_brand_list))
-    gear_brand_selection = st.multiselect('Gear Brand', gear_brand_list, placeholder='Select Gear Brand', key='gear_brand_selection')
-    
 st.header('Timing')
 
+def weekday_label(df: pd.DataFrame) -> pd.DataFrame:
+    # number the weekdays so they sort in order
+    return df.assign(Weekday=(df['weekday_num'] + 1).astype(str) + '-' + df['Weekday'].astype(str))
+
+# charts by tab. Charts with the same group by columns are aggregated together
+month_type = {'monthly_date': 'Month', 'type': 'Activity Type'}
+day_type = {'weekday': 'Weekday', 'type': 'Activity Type'}
+hour_type = {'start_time_local_24h_hour': 'Hour', 'type': 'Activity Type'}
+all_years = 'Best results when using all years available in filter'
+
+month_charts = [
+    fn.ChartSpec('Total Activities By Month By Activity Type', ['monthly_date', 'type'], 'upload_id', 'count', 'Activities', chart='bar', labels=month_type, color='Activity Type', caption=all_years),
+    fn.ChartSpec('Total Distance By Month By Activity Type', ['monthly_date', 'type'], 'distance_activity', 'sum', 'Distance', chart='bar', labels=month_type, color='Activity Type', y_label='Distance (mi)', caption=all_years),
+    fn.ChartSpec('Total Elevation By Month By Activity Type', ['monthly_date', 'type'], 'total_elevation_gain', 'sum', 'Elevation', chart='bar', labels=month_type, color='Activity Type', y_label='Elevation (ft)', caption=all_years),
+    fn.ChartSpec('Total Time By Month By Activity Type', ['monthly_date', 'type'], 'moving_time', 'sum', 'Time', chart='bar', labels=month_type, color='Activity Type', y_label='Time (hrs)', convert=fn.to_hours, caption=all_years),
+]
+day_charts = [
+    fn.ChartSpec('Total Activities By Weekday By Activity Type', ['weekday_num', 'weekday', 'type'], 'upload_id', 'count', 'Activities', chart='bar', labels=day_type, color='Activity Type', prepare=weekday_label, x_column='Weekday'),
+    fn.ChartSpec('Total Distance By Weekday By Activity Type', ['weekday_num', 'weekday', 'type'], 'distance_activity', 'sum', 'Distance', chart='bar', labels=day_type, color='Activity Type', y_label='Distance (mi)', prepare=weekday_label, x_column='Weekday'),
+    fn.ChartSpec('Total Elevation By Weekday By Activity Type', ['weekday_num', 'weekday', 'type'], 'total_elevation_gain', 'sum', 'Elevation', chart='bar', labels=day_type, color='Activity Type', y_label='Elevation (ft)', prepare=weekday_label, x_column='Weekday'),
+    fn.ChartSpec('Total Time By Weekday By Activity Type', ['weekday_num', 'weekday', 'type'], 'moving_time', 'sum', 'Time', chart='bar', labels=day_type, color='Activity Type', y_label='Time (hrs)', convert=fn.to_hours, prepare=weekday_label, x_column='Weekday'),
+]
+hour_charts = [
+    fn.ChartSpec('Total Activities By Hour By Activity Type', ['start_time_local_24h_hour', 'type'], 'upload_id', 'count', 'Activities', chart='bar', labels=hour_type, color='Activity Type'),
+    fn.ChartSpec('Total Distance By Hour By Activity Type', ['start_time_local_24h_hour', 'type'], 'distance_activity', 'sum', 'Distance', chart='bar', labels=hour_type, color='Activity Type', y_label='Distance (mi)'),
+    fn.ChartSpec('Total Elevation By Hour By Activity Type', ['start_time_local_24h_hour', 'type'], 'total_elevation_gain', 'sum', 'Elevation', chart='bar', labels=hour_type, color='Activity Type', y_label='Elevation (ft)'),
+    fn.ChartSpec('Total Time By Hour By Activity Type', ['start_time_local_24h_hour', 'type'], 'moving_time', 'sum', 'Time', chart='bar', labels=hour_type, color='Activity Type', y_label='Time (hrs)', convert=fn.to_hours),
+]
+
+charts = fn.plan_charts(month_charts + day_charts + hour_charts, df, year_selection, locals())
+
 tab_month, tab_day, tab_time = st.tabs(['Month', 'Day', 'Time of Day'])
 
-with tab_month:
-    
-    with st.container():
-        
-        st.subheader('Total Activities By Month By Activity Type')
-        st.caption('Best results when using all years available in filter')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['monthly_date', 'type']).agg(Activities=('upload_id', 'count')).reset_index().rename(columns={'monthly_date': 'Month', 'type': 'Activity Type'})
-        st.bar_chart(temp_df, x='Month', y='Activities', color='Activity Type')
-        
-        st.subheader('Total Distance By Month By Activity Type')
-        st.caption('Best results when using all years available in filter')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['monthly_date', 'type']).agg(Distance=('distance_activity', 'sum')).reset_index().rename(columns={'monthly_date': 'Month', 'type': 'Activity Type'})
-        st.bar_chart(temp_df, x='Month', y='Distance', y_label='Distance (mi)', color='Activity Type')
-        
-        st.subheader('Total Elevation By Month By Activity Type')
-        st.caption('Best results when using all years available in filter')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['monthly_date', 'type']).agg(Elevation=('total_elevation_gain', 'sum')).reset_index().rename(columns={'monthly_date': 'Month', 'type': 'Activity Type'})
-        st.bar_chart(temp_df, x='Month', y='Elevation', y_label='Elevation (ft)', color='Activity Type')
-        
-        st.subheader('Total Time By Month By Activity Type')
-        st.caption('Best results when using all years available in filter')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['monthly_date', 'type']).agg(Time=('moving_time', 'sum')).reset_index().rename(columns={'monthly_date': 'Month', 'type': 'Activity Type'})
-        temp_df['Time'] = (temp_df['Time'].dt.total_seconds() / 3600).round(2)
-        st.bar_chart(temp_df, x='Month', y='Time', y_label='Time (hrs)', color='Activity Type')
-        
-with tab_day:
-    
-    with st.container():
-        
-        st.subheader('Total Activities By Weekday By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['weekday_num', 'weekday', 'type']).agg(Activities=('upload_id', 'count')).reset_index().rename(columns={'weekday': 'Weekday', 'type': 'Activity Type'})
-        temp_df['Weekday'] = (temp_df['weekday_num'] + 1).astype(str) + '-' + temp_df['Weekday']
-        st.bar_chart(temp_df, x='Weekday', y='Activities', color='Activity Type')
-        
-        st.subheader('Total Distance By Weekday By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['weekday_num', 'weekday', 'type']).agg(Distance=('distance_activity', 'sum')).reset_index().rename(columns={'weekday': 'Weekday', 'type': 'Activity Type'})
-        temp_df['Weekday'] = (temp_df['weekday_num'] + 1).astype(str) + '-' + temp_df['Weekday']
-        st.bar_chart(temp_df, x='Weekday', y='Distance', y_label='Distance (mi)', color='Activity Type')
-        
-        st.subheader('Total Elevation By Weekday By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['weekday_num', 'weekday', 'type']).agg(Elevation=('total_elevation_gain', 'sum')).reset_index().rename(columns={'weekday': 'Weekday', 'type': 'Activity Type'})
-        temp_df['Weekday'] = (temp_df['weekday_num'] + 1).astype(str) + '-' + temp_df['Weekday']
-        st.bar_chart(temp_df, x='Weekday', y='Elevation', y_label='Elevation (ft)', color='Activity Type')
-        
-        st.subheader('Total Time By Weekday By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['weekday_num', 'weekday', 'type']).agg(Time=('moving_time', 'sum')).reset_index().rename(columns={'weekday': 'Weekday', 'type': 'Activity Type'})
-        temp_df['Time'] = (temp_df['Time'].dt.total_seconds() / 3600).round(2)
-        temp_df['Weekday'] = (temp_df['weekday_num'] + 1).astype(str) + '-' + temp_df['Weekday']
-        st.bar_chart(temp_df, x='Weekday', y='Time', y_label='Time (hrs)', color='Activity Type')
-        
-with tab_time:
-    
-    with st.container():
-        
-        st.subheader('Total Activities By Hour By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['start_time_local_24h_hour', 'type']).agg(Activities=('upload_id', 'count')).reset_index().rename(columns={'start_time_local_24h_hour': 'Hour', 'type': 'Activity Type'})
-        st.bar_chart(temp_df, x='Hour', y='Activities', color='Activity Type')
-        
-        st.subheader('Total Distance By Hour By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['start_time_local_24h_hour', 'type']).agg(Distance=('distance_activity', 'sum')).reset_index().rename(columns={'start_time_local_24h_hour': 'Hour', 'type': 'Activity Type'})
-        st.bar_chart(temp_df, x='Hour', y='Distance', y_label='Distance (mi)', color='Activity Type')
-        
-        st.subheader('Total Elevation By Hour By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['start_time_local_24h_hour', 'type']).agg(Elevation=('total_elevation_gain', 'sum')).reset_index().rename(columns={'start_time_local_24h_hour': 'Hour', 'type': 'Activity Type'})
-        st.bar_chart(temp_df, x='Hour', y='Elevation', y_label='Elevation (ft)', color='Activity Type')
-        
-        st.subheader('Total Time By Hour By Activity Type')
-        temp_df = fn.df_query_builder(df, year_selection, locals()).groupby(['start_time_local_24h_hour', 'type']).agg(Time=('moving_time', 'sum')).reset_index().rename(columns={'start_time_local_24h_hour': 'Hour', 'type': 'Activity Type'})
-        temp_df['Time'] = (temp_df['Time'].dt.total_seconds() / 3600).round(2)
-        st.bar_chart(temp_df, x='Hour', y='Time', y_label='Time (hrs)', color='Activity Type')
\ No newline at end of file
+for tab, tab_charts in [(tab_month, month_charts), (tab_day, day_charts), (tab_time, hour_charts)]:
+    with tab:
+        with st.container():
+            for spec in tab_charts:
+                fn.render_chart(spec, charts)
@@ -0,0 +1,49 @@
+'''Command line sync. Runs the same fetch, enrich, transform, and store pipeline as the Refresh Data button so it can be scheduled
+with cron and the app only reads pre-built data.
+
+Secrets are read from environment variables named after the keys in .streamlit/secrets.toml in upper case (CLIENT_ID,
+CLIENT_SECRET, REFRESH_TOKEN, SUPABASE_URL, SUPABASE_SECRET), falling back to the secrets file.
+
+Run with: python -m sync [--full] [--average-weather] [--backend {rest,postgres}]
+
+Example crontab entry, every morning at 6:
+    0 6 * * * cd /path/to/tom_runs_the_world && python -m sync >> data/sync.log 2>&1'''
+
+import argparse
+import sys
+
+import functions as fn
+
+def main(argv: list | None = None) -> int:
+    '''This function runs one sync from the command line
+
+    Args:
+        argv (list): Command line arguments. Defaults to sys.argv
+
+    Returns:
+        int: Exit code. 0 when the sync finished or another sync was already running, 1 when it failed'''
+
+    parser = argparse.ArgumentParser(prog='python -m sync', description='Sync Strava activities to the database and local snapshot.')
+    parser.add_argument('--full', action='store_true', help='download every activity again instead of only the new ones')
+    parser.add_argument('--average-weather', action='store_true', help='average the weather over the whole activity')
+    parser.add_argument('--backend', choices=['rest', 'postgres'], default='rest',
+                        help='rest syncs changed rows through the Supabase API, postgres rebuilds the whole table with COPY')
+    args = parser.parse_args(argv)
+
+    reporter = fn.ConsoleReporter()
+
+    try:
+        df = fn.refresh_dataset(reporter, full=args.full, average_weather=args.average_weather, backend=args.backend)
+    except fn.SyncLocked as exc:
+        # an overlapping run from cron is not an error
+        reporter.write(str(exc))
+        return 0
+    except Exception as exc:
+        reporter.update(f'Sync failed: {exc}', state='error')
+        return 1
+
+    reporter.write(f'Stored {len(df)} activities')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
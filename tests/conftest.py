@@ -0,0 +1,45 @@
+'''Shared fixtures for the tests'''
+
+import numpy as np
+import pandas as pd
+import pytest
+
+def make_activities(n: int = 400, seed: int = 0) -> pd.DataFrame:
+    '''This function builds stored activities with every column the pages read'''
+
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2025-01-01') + pd.to_timedelta(np.sort(rng.integers(0, 365 * 24 * 3600, n)), unit='s')
+    brands = rng.choice(['Nike', 'Hoka', 'Trek'], n)
+
+    return pd.DataFrame({
+        'id_activity': np.arange(n),
+        'upload_id': np.arange(n),
+        'name_activity': 'Morning Activity',
+        'type': rng.choice(['Run', 'Ride', 'Walk', 'Hike'], n),
+        'start_date': (start + pd.Timedelta(hours=5)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'start_date_local': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'moving_time': rng.integers(600, 7200, n),
+        'elapsed_time': rng.integers(600, 7200, n),
+        'distance_activity': rng.gamma(2, 2, n).round(2),
+        'total_elevation_gain': rng.gamma(2, 50, n).round(1),
+        'elev_high': rng.normal(300, 20, n).round(1),
+        'elev_low': rng.normal(100, 20, n).round(1),
+        'average_speed': rng.normal(6, 1, n).round(2),
+        'max_speed': rng.normal(9, 1, n).round(2),
+        'average_heartrate': rng.normal(150, 10, n).round(1),
+        'max_heartrate': rng.normal(175, 10, n).round(),
+        'suffer_score': rng.gamma(2, 20, n).round(),
+        'temp': rng.normal(60, 15, n).round(1),
+        'rhum': rng.uniform(20, 100, n).round(),
+        'gear_id': brands,
+        'name_gear': np.char.add(brands.astype(str), ' 1'),
+        'brand_name': brands,
+        'retired': False,
+        'refresh_date': '2025-12-31 01:00 PM',
+    })
+
+@pytest.fixture(scope='session')
+def stored_activities() -> pd.DataFrame:
+    '''Synthetic activities as they are stored in the database. Copy before changing them'''
+
+    return make_activities()
@@ -0,0 +1,89 @@
+'''Round trip tests for the database codec: activities encoded for the supabase table and decoded again keep their values.
+
+Run from the project folder with: python -m pytest'''
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import functions as fn
+
+@pytest.fixture
+def activities() -> pd.DataFrame:
+    '''Typed activities with long durations, missing values, and string copies of ids'''
+
+    df = pd.DataFrame({
+        'id_activity': [1, 2, 3],
+        'type': ['Run', 'Ride', 'Hike'],
+        'distance_activity': [3.1, 100.25, np.nan],
+        'moving_time': pd.to_timedelta([1800, 25 * 3600 + 30 * 60 + 5, None], unit='s'),
+        'elapsed_time': pd.to_timedelta([1900, 50 * 3600, 7200], unit='s'),
+        'start_date': pd.to_datetime(['2024-05-01 10:00:00', None, '2024-06-01 18:30:15']),
+        'start_date_local': pd.to_datetime(['2024-05-01 06:00:00', '2024-05-20 23:59:59', '2024-06-01 14:30:15']),
+        'athlete.id_str': ['12345', '12345', '12345'],
+        'upload_id_str': ['9', '8', '7'],
+    })
+    df = fn.add_date_columns(df)
+    df.loc[1, 'start_time_local_24h'] = None
+
+    return df
+
+def test_intervals_over_24_hours_are_not_wrapped(activities):
+
+    encoded = fn.encode_activities(activities)
+
+    assert encoded['moving_time'].tolist() == ['00:30:00', '25:30:05', None]
+    assert encoded['elapsed_time'].tolist() == ['00:31:40', '50:00:00', '02:00:00']
+
+    decoded = fn.decode_activities(encoded.copy())
+
+    pd.testing.assert_series_equal(decoded['moving_time'], activities['moving_time'])
+    pd.testing.assert_series_equal(decoded['elapsed_time'], activities['elapsed_time'])
+
+def test_missing_values_are_stored_as_none(activities):
+
+    encoded = fn.encode_activities(activities)
+
+    assert encoded.loc[1, 'start_date'] is None
+    assert encoded.loc[1, 'start_time_local_24h'] is None
+    assert encoded.loc[2, 'moving_time'] is None
+    assert encoded.loc[2, 'distance_activity'] is None
+    assert encoded.loc[0, 'start_date'] == '2024-05-01T10:00:00'
+    assert encoded.loc[0, 'start_time_local_24h'] == '06:00:00'
+
+def test_missing_values_decode_to_nat(activities):
+
+    decoded = fn.decode_activities(fn.encode_activities(activities).copy())
+
+    pd.testing.assert_series_equal(decoded['start_date'], activities['start_date'])
+    pd.testing.assert_series_equal(decoded['start_date_local'], activities['start_date_local'])
+    assert pd.isna(decoded.loc[2, 'moving_time'])
+
+    # time of day is derived again from start_date_local
+    assert decoded.loc[1, 'start_time_local_24h'] == datetime.time(23, 59, 59)
+
+def test_date_parts_are_derived_again(activities):
+
+    decoded = fn.decode_activities(fn.encode_activities(activities).copy())
+
+    for col in ['weekday', 'month', 'month_year', 'monthly_date', 'month_year_name', 'year']:
+        pd.testing.assert_series_equal(decoded[col], activities[col], check_dtype=False)
+
+def test_athlete_id_str_is_renamed_and_other_str_columns_dropped(activities):
+
+    encoded = fn.encode_activities(activities)
+
+    assert 'athlete.id' in encoded.columns
+    assert 'athlete.id_str' not in encoded.columns
+    assert 'upload_id_str' not in encoded.columns
+    assert encoded['athlete.id'].tolist() == ['12345', '12345', '12345']
+
+def test_encoding_does_not_change_the_input(activities):
+
+    original = activities.copy()
+
+    fn.encode_activities(activities)
+
+    pd.testing.assert_frame_equal(activities, original)
@@ -0,0 +1,37 @@
+'''Tests for the shared dataset, its metadata, and the results cached from it.
+
+Run from the project folder with: python -m pytest'''
+
+import numpy as np
+import pandas as pd
+
+import functions as fn
+
+def test_latest_refresh_date_compares_times_not_text():
+
+    # as text, 11:00 AM sorts after 01:00 PM on the same day
+    dates = pd.Series(['2025-06-01 11:00 AM', '2025-06-01 01:00 PM', '2025-05-31 11:59 PM', None])
+
+    assert fn.latest_refresh_date(dates) == '2025-06-01 01:00 PM'
+
+def test_metadata_and_version_use_the_latest_refresh_date(stored_activities):
+
+    df = stored_activities.copy()
+    df['refresh_date'] = np.where(df.index % 2 == 0, '2025-06-01 11:00 AM', '2025-06-01 01:00 PM')
+
+    dataset = fn.prepare_dataset(df)
+
+    assert dataset.metadata.refresh_date == '2025-06-01 01:00 PM'
+    assert dataset.version == f'local|2025-06-01 01:00 PM|{len(df)}'
+
+def test_cached_section_is_keyed_by_the_dataset_the_page_loaded(stored_activities):
+
+    old = fn.prepare_dataset(stored_activities.copy(), version='old')
+    new = fn.prepare_dataset(stored_activities.copy(), version='new')
+    page_vars = {'act_type_selection': ['Run'], 'gear_brand_selection': ['Nike'], 'rolling_12_months': None, 'dataset': old}
+
+    assert fn.cached_section('test_section', lambda: 'built from old', 'All', page_vars) == 'built from old'
+
+    # a page that loaded the newer dataset does not get results built from the older one
+    assert fn.cached_section('test_section', lambda: 'built from new', 'All', {**page_vars, 'dataset': new}) == 'built from new'
+    assert fn.cached_section('test_section', lambda: 'built again', 'All', page_vars) == 'built from old'
@@ -0,0 +1,35 @@
+'''Page tests: every page is rendered twice with the same filters, the second time from the cached sections of the first, on
+a synthetic dataset published to the shared store.
+
+Run from the project folder with: python -m pytest'''
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import functions as fn
+
+PAGES = ['pages/1_Gear.py', 'pages/2_Weather.py', 'pages/3_Performance.py', 'pages/4_Timing.py', 'pages/5_Activity Data.py']
+
+@pytest.fixture(scope='module', autouse=True)
+def dataset(stored_activities):
+
+    # published the way a finished refresh is, so no page reaches the database
+    return fn.get_dataset_store().publish(stored_activities.copy())
+
+def render(page: str) -> AppTest:
+    '''This function opens the app and switches to a page, the way a new session would'''
+
+    at = AppTest.from_file('../Overview.py', default_timeout=60).run()
+    assert not at.exception, [exc.value for exc in at.exception]
+
+    return at.switch_page(page).run()
+
+@pytest.mark.parametrize('page', PAGES)
+def test_page_renders_twice(page):
+
+    first = render(page)
+    assert not first.exception, [exc.value for exc in first.exception]
+
+    # a second session with the same filters is served from the cached sections
+    second = render(page)
+    assert not second.exception, [exc.value for exc in second.exception]